@@ -1,3 +1,7 @@
+import concurrent.futures
+import functools
+import pathlib
+
 import pandas as pd
 import pyhydrophone as pyhy
 
@@ -5,18 +9,6 @@ from pypam import acoustic_survey
 import argparse
 
 
-parser = argparse.ArgumentParser(description='Clean the calibration tones')
-parser.add_argument('folder_path', metavar='N', type=str, nargs='+', help='folder where the wav files are')
-parser.add_argument('hydrophone', metavar='N', type=str, nargs='+', help='Name of the hydrophone')
-parser.add_argument('--includedirs', metavar='N', type=int, nargs='+', help='Add if the subfloders have to be added')
-
-args = parser.parse_args()
-
-folder_path = args.folder_path
-if args.includedirs:
-    include_dirs = True
-else:
-    include_dirs = False
 zipped = False
 
 # Hydrophone Setup
@@ -33,21 +25,43 @@ bk_name = 'B&K'
 amplif0 = 10e-3
 bk = pyhy.BruelKjaer(name=bk_name, model=bk_model, amplif=amplif0, serial_number=1)
 
+hydrophones = {name: soundtrap, bk_name: bk}
 
-def cut_and_separate_files(folder, hydrophone):
+# Extensions of the metadata files to move together with the wav files
+EXTENSIONS = ('.accel.csv', '.temp.csv', '.log.xml')
+
+
+def cut_and_separate_files(folder, hydrophone, include_dirs=False):
+    # Only parse the columns that are used
+    metadata = pd.read_csv(folder.joinpath('metadata.csv'), usecols=['Location', 'start', 'stop'])
+    # Parse all the dates at once instead of once per row
+    metadata['start'] = pd.to_datetime(metadata['start'], cache=True)
+    metadata['stop'] = pd.to_datetime(metadata['stop'], cache=True)
+    # Only the files which can be inside one of the periods will be opened
+    time_filter = tuple(metadata[['start', 'stop']].itertuples(index=False, name=None))
     asa = acoustic_survey.ASA(hydrophone=hydrophone, folder_path=folder, zipped=zipped,
-                              include_dirs=include_dirs, utc=False)
-    metadata = pd.read_csv(folder.joinpath('metadata.csv'))
-    for index in metadata.index:
-        row = metadata.iloc[index]
-        folder_name = row['Location']
-        period = (row['start'], row['stop'])
-        asa.cut_and_place_files_period(period=period, folder_name=folder_name,
-                                       extensions=['.accel.csv', '.temp.csv', '.log.xml'])
+                              include_dirs=include_dirs, time_filter=time_filter)
+    # The periods of a folder are cut one after the other: consecutive periods can split the same file. The ASA
+    # scans the folder again after each cut, so the files split by the previous periods are seen
+    for folder_name, start, stop in metadata[['Location', 'start', 'stop']].itertuples(index=False, name=None):
+        asa.cut_and_place_files_period(period=(start, stop), folder_name=folder_name, extensions=EXTENSIONS)
 
 
 if __name__ == "__main__":
     """
     Order the SoundTrap files in different folders
     """
-    cut_and_separate_files(folder_path, soundtrap)
+    parser = argparse.ArgumentParser(description='Clean the calibration tones')
+    parser.add_argument('folder_path', type=pathlib.Path, nargs='+', help='folders where the wav files are')
+    parser.add_argument('hydrophone', type=str, choices=list(hydrophones.keys()), help='Name of the hydrophone')
+    parser.add_argument('--includedirs', type=int, default=0, help='Set to 1 if the subfolders have to be added')
+    parser.add_argument('--n_workers', metavar='N', type=int, default=1,
+                        help='Number of processes to cut the folders in parallel (one folder per process). The '
+                             'folders can not be inside each other')
+    args = parser.parse_args()
+
+    # Each folder is cut by one process, which cuts its periods one after the other
+    f = functools.partial(cut_and_separate_files, hydrophone=hydrophones[args.hydrophone],
+                          include_dirs=bool(args.includedirs))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.n_workers) as executor:
+        list(executor.map(f, args.folder_path))
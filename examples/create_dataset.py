@@ -1,6 +1,10 @@
+import atexit
+import os
 import pathlib
+import pickle
 
 import pyhydrophone as pyhy
+import scipy.fft
 import pypam
 
 
@@ -41,10 +45,16 @@ instruments = {'SoundTrap': soundtrap, 'uPam': upam, 'B&K': bk}
 REF_PRESSURE = 1e-6
 
 # SURVEY PARAMETERS
+# Use a 5-smooth fft length (only 2, 3 and 5 factors), otherwise scipy falls back to the slower Bluestein algorithm.
+# scipy.fft.next_fast_len(n, real=True) gives the closest one above n
 nfft = 4096
 binsize = 60.0
 overlap = 0.5
 dc_subtract = False
+# float32 is enough for 16 and 24 bit recordings and halves the memory used in all the computations
+dtype = 'float32'
+# Deployments are processed in parallel, one per process
+n_workers = max(1, os.cpu_count() // 2)
 band_lf = [50, 500]
 band_mf = [500, 2000]
 band_hf = [2000, 20000]
@@ -54,10 +64,36 @@ frequency_features = ['third_octaves_levels']
 
 n_join_bins = 3
 
+# File to keep the pyFFTW plans (wisdom) between runs
+wisdom_path = pathlib.Path.home().joinpath('.pypam_wisdom')
+
+
+def use_pyfftw_backend(wisdom_file):
+    """
+    Use pyFFTW as the scipy.fft backend (also used by scipy.signal). All the ffts have the same size, so the plans
+    are computed once and reused, also in the following runs thanks to the wisdom file.
+    Raises ImportError if pyFFTW is not installed
+    """
+    import pyfftw
+    import pyfftw.interfaces.scipy_fft
+
+    pyfftw.interfaces.cache.enable()
+    pyfftw.interfaces.cache.set_keepalive_time(60)
+    if wisdom_file.exists():
+        pyfftw.import_wisdom(pickle.loads(wisdom_file.read_bytes()))
+    atexit.register(lambda: wisdom_file.write_bytes(pickle.dumps(pyfftw.export_wisdom())))
+    scipy.fft.set_global_backend(pyfftw.interfaces.scipy_fft)
+
+
 if __name__ == "__main__":
+    try:
+        use_pyfftw_backend(wisdom_path)
+    except ImportError:
+        print('pyFFTW is not installed, using the default scipy fft backend')
     # Create the dataset object
     ds = pypam.dataset.DataSet(summary_path, output_folder, instruments, temporal_features=temporal_features,
                                frequency_features=frequency_features, bands_list=band_list, binsize=binsize,
-                               nfft=nfft, overlap=overlap, dc_subtract=dc_subtract, n_join_bins=n_join_bins)
+                               nfft=nfft, overlap=overlap, dc_subtract=dc_subtract, n_join_bins=n_join_bins,
+                               dtype=dtype, n_workers=n_workers)
     # Call the dataset creation. Will create the files in the corresponding folder
     ds()
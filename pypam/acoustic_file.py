@@ -52,9 +52,15 @@ class AcuFile:
         the function calibrate from the hydrophone is performed, and the first samples ignored (and hydrophone updated)
     dc_subtract: bool
         Set to True to subtract the dc noise (root mean squared value
+    dtype: string or numpy dtype
+        Data type used to read the samples ('float64' or 'float32'). float32 halves the memory of all the
+        computations, and is enough for 16 and 24 bit recordings
+    fft_workers: int
+        Number of threads used by scipy.fft to compute the spectra of each bin. -1 uses all the cpus
     """
 
-    def __init__(self, sfile, hydrophone, p_ref, timezone='UTC', channel=0, calibration=None, dc_subtract=False):
+    def __init__(self, sfile, hydrophone, p_ref, timezone='UTC', channel=0, calibration=None, dc_subtract=False,
+                 dtype='float64', fft_workers=-1):
         # Save hydrophone model
         self.hydrophone = hydrophone
 
@@ -79,6 +85,8 @@ class AcuFile:
         self.file_path = sfile
         self.file = sf.SoundFile(self.file_path, 'r')
         self.fs = self.file.samplerate
+        # Number of frames of the file, read once from the header
+        self.n_frames = self.file.frames
 
         # Reference pressure in upa
         self.p_ref = p_ref
@@ -108,6 +116,8 @@ class AcuFile:
         self.calibration = calibration
 
         self.dc_subtract = dc_subtract
+        self.dtype = np.dtype(dtype).name
+        self.fft_workers = fft_workers
 
     def __getattr__(self, name):
         """
@@ -140,30 +150,32 @@ class AcuFile:
         of the bin
         """
         if binsize is None:
-            blocksize = self.file.frames - self._start_frame
+            blocksize = self.n_frames - self._start_frame
         else:
             blocksize = self.samples(binsize)
         noverlap = int(bin_overlap * blocksize)
         n_blocks = self._n_blocks(blocksize, noverlap=noverlap)
         time_array, _, _ = self._time_array(binsize, bin_overlap=bin_overlap)
-        for i, block in tqdm(enumerate(sf.blocks(self.file_path, blocksize=blocksize, start=self._start_frame,
-                                                 overlap=bin_overlap, always_2d=True, fill_value=0.0)),
+        # Only one bin is in memory at a time: all the blocks are read into the same buffer
+        out = np.empty((blocksize, self.file.channels), dtype=self.dtype)
+        for i, block in tqdm(enumerate(sf.blocks(self.file_path, start=self._start_frame, overlap=noverlap,
+                                                 always_2d=True, fill_value=0.0, dtype=self.dtype, out=out)),
                              total=n_blocks, leave=False, position=0):
             # Select the desired channel
             block = block[:, self.channel]
             time_bin = time_array[i]
             # Read the signal and prepare it for analysis
             signal_upa = self.wav2upa(wav=block)
-            signal = sig.Signal(signal=signal_upa, fs=self.fs, channel=self.channel)
+            signal = sig.Signal(signal=signal_upa, fs=self.fs, channel=self.channel, fft_workers=self.fft_workers)
             if self.dc_subtract:
                 signal.remove_dc()
-            start_sample = i * blocksize + self._start_frame
+            start_sample = i * (blocksize - noverlap) + self._start_frame
             end_sample = start_sample + len(signal_upa)
             yield i, time_bin, signal, start_sample, end_sample
         self.file.seek(0)
 
     def _n_blocks(self, blocksize, noverlap):
-        return int(np.floor(self.file.frames - self._start_frame) / (blocksize - noverlap))
+        return int(np.floor(self.n_frames - self._start_frame) / (blocksize - noverlap))
 
     def samples(self, bintime):
         """
@@ -197,7 +209,7 @@ class AcuFile:
         """
         Return the total time in seconds of the file
         """
-        return self.samples2time(self.file.frames)
+        return self.samples2time(self.n_frames)
 
     def samples2time(self, samples):
         """
@@ -233,7 +245,7 @@ class AcuFile:
         date : datetime object
             Datetime to check
         """
-        end = self.date + datetime.timedelta(seconds=self.file.frames / self.fs)
+        end = self.date + datetime.timedelta(seconds=self.n_frames / self.fs)
         return (self.date < date) & (end > date)
 
     def split(self, date):
@@ -245,7 +257,7 @@ class AcuFile:
         date : datetime object
             Datetime where to split the file
         """
-        if issubclass(self.file_path, zipfile.ZipExtFile):
+        if isinstance(self.file_path, zipfile.ZipExtFile):
             raise Exception('The split method is not implemented for zipped files')
         if not self.contains_date(date):
             raise Exception('This date is not included in the file!')
@@ -276,7 +288,7 @@ class AcuFile:
         """
         n = np.log2(self.fs / freq_resolution)
         nfft = 2 ** n
-        if nfft > self.file.frames:
+        if nfft > self.n_frames:
             raise Exception('This is not achievable with this sampling rate, '
                             'it must be downsampled!')
         return nfft
@@ -292,7 +304,7 @@ class AcuFile:
         """
         # First time, read the file and store it to not read it over and over
         if self.wav is None:
-            self.wav = self.file.read()
+            self.wav = self.file.read(dtype=self.dtype)
             self.file.seek(0)
         if units == 'wav':
             signal = self.wav
@@ -314,11 +326,11 @@ class AcuFile:
         Return a time array for each point of the signal
         """
         if binsize is None:
-            total_block = self.file.frames - self._start_frame
+            total_block = self.n_frames - self._start_frame
         else:
             total_block = self.samples(binsize)
         blocksize = total_block - int(total_block) * bin_overlap
-        blocks_samples = np.arange(start=self._start_frame, stop=self.file.frames - 1, step=blocksize)
+        blocks_samples = np.arange(start=self._start_frame, stop=self.n_frames - 1, step=blocksize)
         end_samples = blocks_samples + blocksize
         incr = pd.to_timedelta(blocks_samples / self.fs, unit='seconds')
         self.time = self.date + datetime.timedelta(seconds=self._start_frame / self.fs) + incr
@@ -346,12 +358,17 @@ class AcuFile:
         # Read if no signal is passed
         if wav is None:
             wav = self.signal('wav')
+        # Keep the precision of the wav (numba would upcast a float32 array multiplied by a python float)
+        return utils.set_gain(wave=wav, gain=wav.dtype.type(self.upa_gain()))
+
+    def upa_gain(self):
+        """
+        Return the gain to convert the wav signal (-1 to 1) to upa, according to the hydrophone
+        """
         # First convert it to Volts and then to Pascals according to sensitivity
         mv = 10 ** (self.hydrophone.sensitivity / 20.0) * self.p_ref
         ma = 10 ** (self.hydrophone.preamp_gain / 20.0) * self.p_ref
-        gain_upa = (self.hydrophone.Vpp / 2.0) / (mv * ma)
-
-        return utils.set_gain(wave=wav, gain=gain_upa)
+        return (self.hydrophone.Vpp / 2.0) / (mv * ma)
 
     def wav2db(self, wav=None):
         """
@@ -366,8 +383,8 @@ class AcuFile:
         # Read if no signal is passed
         if wav is None:
             wav = self.signal('wav')
-        upa = self.wav2upa(wav)
-        return utils.to_db(wave=upa, ref=self.p_ref, square=True)
+        # The upa signal is not stored, the gain and the conversion to db are done in the same pass
+        return utils.gain_to_db(wav, self.upa_gain(), ref=self.p_ref)
 
     def db2upa(self, db=None):
         """
@@ -429,10 +446,7 @@ class AcuFile:
         ]
 
         metadata_attrs = {}
-        for k in metadata_keys:
-            d = self
-            for sub_k in k.split('.'):
-                d = d.__dict__[sub_k]
+        for k, d in zip(metadata_keys, operator.attrgetter(*metadata_keys)(self)):
             if isinstance(d, pathlib.Path):
                 d = str(d)
             if d is None:
@@ -441,6 +455,31 @@ class AcuFile:
 
         return metadata_attrs
 
+    def _sort_bands(self, band_list):
+        """
+        Return the bands in the order they have to be processed (the bands are filtered one after the other)
+
+        Parameters
+        ----------
+        band_list: list of tuples, tuple or None
+            Bands to filter. If set to None, the broadband up to the Nyquist frequency is returned
+        """
+        # Bands selected to study
+        if band_list is None:
+            band_list = [[None, self.fs / 2]]
+
+        # Sort bands to diminish downsampling efforts!
+        sorted_bands = []
+        for band in band_list:
+            if len(sorted_bands) == 0:
+                sorted_bands = [band]
+            else:
+                if band[1] >= sorted_bands[-1][1]:
+                    sorted_bands = [band] + sorted_bands
+                else:
+                    sorted_bands = sorted_bands + [band]
+        return sorted_bands
+
     def _apply_multiple(self, method_list, binsize=None, band_list=None, bin_overlap=0, **kwargs):
         """
         Apply multiple methods per bin to save computational time
@@ -466,20 +505,7 @@ class AcuFile:
         # TODO decide if it is downsampled or not
         downsample = False
 
-        # Bands selected to study
-        if band_list is None:
-            band_list = [[None, self.fs / 2]]
-
-        # Sort bands to diminish downsampling efforts!
-        sorted_bands = []
-        for band in band_list:
-            if len(sorted_bands) == 0:
-                sorted_bands = [band]
-            else:
-                if band[1] >= sorted_bands[-1][1]:
-                    sorted_bands = [band] + sorted_bands
-                else:
-                    sorted_bands = sorted_bands + [band]
+        sorted_bands = self._sort_bands(band_list)
 
         # Define an empty dataset
         ds = xarray.Dataset()
@@ -553,6 +579,38 @@ class AcuFile:
         rms_ds = self._apply(method_name='rms', binsize=binsize, bin_overlap=bin_overlap, db=db)
         return rms_ds
 
+    def rms_sum_count(self, binsize=None, bin_overlap=0, db=True, band_list=None):
+        """
+        Return the sum and the number of the rms values of all the bins (and bands), without storing them.
+        Used to compute the mean rms of a survey in a single pass
+
+        Parameters
+        ----------
+        binsize : float, in sec
+            Time window considered. If set to None, only one value is returned
+        bin_overlap : float [0 to 1]
+            Percentage to overlap the bin windows
+        db : bool
+            If set to True the result will be given in db, otherwise in upa
+        band_list: list of tuples, tuple or None
+            Bands to filter. If set to None, the broadband up to the Nyquist frequency will be analyzed
+
+        Returns
+        -------
+        Tuple (sum, count). Nan values are not counted
+        """
+        sorted_bands = self._sort_bands(band_list)
+        total = 0.0
+        count = 0
+        for _, _, signal, _, _ in self._bins(binsize, bin_overlap=bin_overlap):
+            for band in sorted_bands:
+                signal.set_band(band, downsample=False)
+                rms_val = signal.rms(db=db)
+                if not np.isnan(rms_val):
+                    total += rms_val
+                    count += 1
+        return total, count
+
     def aci(self, binsize=None, bin_overlap=0, nfft=1024, fft_overlap=0.5):
         """
         Calculation of root mean squared value (rms) of the signal in upa for each bin
@@ -678,20 +736,25 @@ class AcuFile:
             band = [None, self.fs / 2]
         oct_str = 'oct%s' % fraction
 
-        # Create an empty dataset
-        da = xarray.DataArray()
+        # Accumulate the levels of all the bins and build the DataArray once
+        ids, start_samples, end_samples, time_bins, levels_list = [], [], [], [], []
+        fbands = None
         for i, time_bin, signal, start_sample, end_sample in self._bins(binsize, bin_overlap=bin_overlap):
             signal.set_band(band, downsample=downsample)
             fbands, levels = signal.octave_levels(db, fraction)
-            da_levels = xarray.DataArray(data=[levels],
-                                         coords={'id': [i], 'start_sample': ('id', [start_sample]),
-                                                 'end_sample': ('id', [end_sample]), 'datetime': ('id', [time_bin]),
-                                                 'frequency': fbands},
-                                         dims=['id', 'frequency'])
-            if i == 0:
-                da = da_levels
-            else:
-                da = xarray.concat((da, da_levels), 'id')
+            ids.append(i)
+            start_samples.append(start_sample)
+            end_samples.append(end_sample)
+            time_bins.append(time_bin)
+            levels_list.append(levels)
+        if len(levels_list) == 0:
+            da = xarray.DataArray()
+        else:
+            da = xarray.DataArray(data=np.stack(levels_list),
+                                  coords={'id': ids, 'start_sample': ('id', start_samples),
+                                          'end_sample': ('id', end_samples), 'datetime': ('id', time_bins),
+                                          'frequency': fbands},
+                                  dims=['id', 'frequency'])
 
         ds = xarray.Dataset(data_vars={oct_str: da}, attrs=self._get_metadata_attrs())
         return ds
@@ -1003,7 +1066,7 @@ class AcuFile:
                                                    max_duration=max_duration,
                                                    threshold=threshold, dt=dt, detection_band=detection_band,
                                                    analysis_band=analysis_band)
-        total_events = pd.DataFrame()
+        events_list = []
         for _, time_bin, signal, start_sample, end_sample in self._bins(binsize):
             signal.set_band(band=analysis_band, downsample=False)
             if save_path is not None:
@@ -1014,7 +1077,8 @@ class AcuFile:
             events_df['datetime'] = pd.to_timedelta(events_df[('temporal', 'start_seconds')],
                                                     unit='seconds') + time_bin
             events_df = events_df.set_index('datetime')
-            total_events = pd.concat([total_events, events_df])
+            events_list.append(events_df)
+        total_events = utils.concat_df(events_list)
         if save_path is not None:
             csv_path = save_path.joinpath('%s.csv' % datetime.datetime.strftime(self.date, "%y%m%d_%H%M%S"))
             total_events.to_csv(csv_path)
@@ -1041,16 +1105,16 @@ class AcuFile:
             detector = loud_event_detector.ShipDetector(min_duration=min_duration,
                                                         threshold=threshold)
 
-        total_events = pd.DataFrame()
+        events_list = []
         for i, time_bin, signal, start_sample, end_sample in self._bins(binsize):
             events_df = detector.detect_events(signal, verbose=verbose)
             events_df['start_datetime'] = pd.to_timedelta(events_df.start_seconds, unit='seconds') + time_bin
             seconds_start = binsize * i
             events_df['start_seconds'] = events_df['start_seconds'] + seconds_start
             events_df['end_seconds'] = events_df['end_seconds'] + seconds_start
-            total_events = pd.concat([total_events, events_df])
+            events_list.append(events_df)
 
-        return total_events
+        return utils.concat_df(events_list)
 
     def source_separation(self, window_time=1.0, n_sources=15, binsize=None, save_path=None, verbose=False, band=None):
         """
@@ -52,7 +52,7 @@ from scipy import signal as sig
 #     return main_value, temporal_values
 
 
-@njit
+@njit(cache=True)
 def compute_aci(sxx: np.ndarray):
     """
     Return the aci of the signal
@@ -66,21 +66,20 @@ def compute_aci(sxx: np.ndarray):
     -------
     ACI value
     """
-    aci_evo = np.zeros(sxx.shape[1], dtype=np.float64)
-    for j in np.arange(sxx.shape[1]):
-        d = 0
-        i = 0
-        for k in np.arange(1, sxx.shape[0]):
-            dk = np.abs(sxx[k][j] - sxx[k - 1][j])
-            d = d + dk
-            i = i + sxx[k][j]
-        aci_evo[j] = d / i
+    # Accumulate all the time bins at once, row by row, so the inner loop reads contiguous memory
+    d = np.zeros(sxx.shape[1], dtype=np.float64)
+    i = np.zeros(sxx.shape[1], dtype=np.float64)
+    for k in range(1, sxx.shape[0]):
+        for j in range(sxx.shape[1]):
+            d[j] += np.abs(sxx[k, j] - sxx[k - 1, j])
+            i[j] += sxx[k, j]
+    aci_evo = d / i
 
     aci_val = np.sum(aci_evo)
     return aci_val
 
 
-@njit
+@njit(cache=True)
 def compute_bi(sxx, frequencies, min_freq=2000, max_freq=8000):
     """
     Compute the Bioacoustic Index from the spectrogram of an audio signal.
@@ -136,7 +135,7 @@ def compute_bi(sxx, frequencies, min_freq=2000, max_freq=8000):
     return area
 
 
-@njit
+@njit(cache=True)
 def compute_sh(sxx):
     """
     Compute Spectral Entropy of Shannon from the spectrogram of an audio signal.
@@ -246,7 +245,7 @@ def compute_ndsi(s, fs, window_length=1024, anthrophony=None, biophony=None):
     return ndsi
 
 
-@njit
+@njit(cache=True)
 def gini(values):
     """
     Compute the Gini index of values.
@@ -268,7 +267,7 @@ def gini(values):
     return g / n
 
 
-@njit
+@njit(cache=True)
 def compute_aei(sxx, frequencies, max_freq=10000, min_freq=0, db_threshold=-50, freq_step=1000):
     """
     Compute Acoustic Evenness Index of an audio signal.
@@ -302,7 +301,7 @@ def compute_aei(sxx, frequencies, max_freq=10000, min_freq=0, db_threshold=-50,
     return gini(values)
 
 
-@njit
+@njit(cache=True)
 def compute_adi(sxx, frequencies, max_freq=10000, min_freq=0, db_threshold=-50, freq_step=1000):
     """
     Compute Acoustic Diversity Index.
@@ -356,7 +355,7 @@ def compute_adi(sxx, frequencies, max_freq=10000, min_freq=0, db_threshold=-50,
     return adi
 
 
-@njit
+@njit(cache=True)
 def compute_zcr_avg(s, window_length=512, window_hop=256):
     """
     Compute the Zero Crossing Rate of an audio signal.
@@ -383,7 +382,7 @@ def compute_zcr_avg(s, window_length=512, window_hop=256):
     return np.mean(zcr_bins)
 
 
-@njit
+@njit(cache=True)
 def compute_zcr(s):
     """
     Compute the Zero Crossing Rate of an audio signal.
@@ -4,10 +4,19 @@ __credits__ = "Clea Parcerisas"
 __email__ = "clea.parcerisas@vliz.be"
 __status__ = "Development"
 
+import bisect
+import collections
+import concurrent.futures
 import datetime
+import functools
+import io
+import logging
+import multiprocessing
 import operator
 import os
 import pathlib
+import shutil
+import tempfile
 import zipfile
 
 import dateutil.parser as parser
@@ -15,6 +24,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import seaborn as sns
+import soundfile as sf
 import xarray
 from tqdm import tqdm
 
@@ -23,9 +33,18 @@ from pypam import loud_event_detector
 from pypam import plots
 from pypam import utils
 
+logger = logging.getLogger(__name__)
+
 # Apply the default theme
 sns.set_theme()
 
+# Information of a sound file available from its name and header
+SoundFileMeta = collections.namedtuple('SoundFileMeta', ['date', 'frames', 'samplerate'])
+
+# Nanoseconds in a day and in a minute
+DAY_NS = 86_400_000_000_000
+MINUTE_NS = 60_000_000_000
+
 
 class ASA:
     """
@@ -58,6 +77,17 @@ class ASA:
         Set to True to subtract the dc noise (root mean squared value)
     timezone: datetime.tzinfo, pytz.tzinfo.BaseTZInfo, dateutil.tz.tz.tzfile, str or None
         Timezone where the data was recorded in
+    dtype: string or numpy dtype
+        Data type used to read the samples of the files ('float64' or 'float32')
+    time_filter: list of tuples or None
+        List of (start, end) datetime periods. If given, the files which can not contain data of any of the periods
+        (according to the date in their name) are skipped without being opened
+    n_jobs: int
+        Number of processes used to compute the features of the files in parallel. Zipped folders are processed
+        sequentially, unless their files are extracted (see extract_workers)
+    extract_workers: int or None
+        If zipped, number of threads used to extract the files of the zip to a temporary folder before processing them.
+        If None, the files are read directly from the zip
     """
 
     def __init__(self,
@@ -75,11 +105,15 @@ class ASA:
                  channel=0,
                  calibration=None,
                  dc_subtract=False,
-                 extra_attrs=None):
+                 extra_attrs=None,
+                 dtype='float64',
+                 time_filter=None,
+                 n_jobs=1,
+                 extract_workers=None):
 
         self.hydrophone = hydrophone
         self.acu_files = AcousticFolder(folder_path=folder_path, zipped=zipped,
-                                        include_dirs=include_dirs)
+                                        include_dirs=include_dirs, extract_workers=extract_workers)
         self.p_ref = p_ref
         self.binsize = binsize
         self.nfft = nfft
@@ -98,6 +132,19 @@ class ASA:
         self.channel = channel
         self.calibration = calibration
         self.dc_subtract = dc_subtract
+        self.dtype = dtype
+        self.n_jobs = n_jobs
+        # Share the cpus between the processes, so the fft threads of each file don't oversubscribe them
+        if n_jobs > 1:
+            self._fft_workers = max(1, os.cpu_count() // n_jobs)
+        else:
+            self._fft_workers = -1
+        self.time_filter = time_filter
+        # Selected before iterating the folder (not inside a loop over the stateful folder iterator), and again
+        # every time the folder is refreshed (i.e. the files have been split)
+        self._time_filter_files = None
+        self._time_filter_n_refresh = None
+        self._update_time_filter_files()
 
         if extra_attrs is None:
             self.extra_attrs = {}
@@ -110,12 +157,117 @@ class ASA:
         """
         Iterator that returns AcuFile for each wav file in the folder
         """
+        for wav_file, _ in self._files_meta():
+            yield self._hydro_file(wav_file)
+
+    def _files_meta(self):
+        """
+        Iterator that returns the wav file and its SoundFileMeta for each wav file of the survey.
+        The files are discarded from their name and header, before opening (and calibrating) them
+        """
+        self._update_time_filter_files()
         for file_list in tqdm(self.acu_files):
             wav_file = file_list[0]
-            print(wav_file)
-            sound_file = self._hydro_file(wav_file)
-            if sound_file.is_in_period(self.period) and sound_file.file.frames > 0:
-                yield sound_file
+            if not self._is_in_time_filter(wav_file):
+                continue
+            logger.debug('processing %s', wav_file)
+            meta = self._hydro_file_meta(wav_file)
+            if meta.frames == 0 or not self._is_in_period(meta.date):
+                continue
+            yield wav_file, meta
+
+    def _is_in_period(self, date):
+        """
+        Return True if the date is included in the period of the survey (same as AcuFile.is_in_period)
+
+        Parameters
+        ----------
+        date : datetime
+            Date of the file (from its name)
+        """
+        if self.period is None:
+            return True
+        return self.period[0] <= date <= self.period[1]
+
+    def _map_files(self, f):
+        """
+        Apply f to the AcuFile of each file and return the list of outputs, in the order of the files.
+        If n_jobs is larger than 1, the files are processed in parallel (each process opens its own AcuFile)
+
+        Parameters
+        ----------
+        f : callable
+            Function to apply to each AcuFile. It has to be picklable to be run in parallel
+        """
+        return list(self._imap_files(f))
+
+    def _imap_files(self, f):
+        """
+        Same as _map_files, but yielding the outputs one by one (in the order of the files) as they are available
+
+        Parameters
+        ----------
+        f : callable
+            Function to apply to each AcuFile. It has to be picklable to be run in parallel
+        """
+        # Files read from a zip can't be sent to other processes
+        if self.n_jobs == 1 or (self.acu_files.zipped and self.acu_files.extract_workers is None):
+            for sound_file in self._files():
+                yield f(sound_file)
+            return
+        # Only the paths are needed here, each process opens (and calibrates) its own AcuFile
+        wav_files = [wav_file for wav_file, _ in self._files_meta()]
+        # Spawn the processes: forking after the numba threads have been started can deadlock.
+        # The ASA and f are sent once to each process, only the paths are sent with each task
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.n_jobs,
+                                                    mp_context=multiprocessing.get_context('spawn'),
+                                                    initializer=_init_worker, initargs=(self, f)) as executor:
+            yield from executor.map(_apply_to_file, wav_files)
+
+    def _is_in_time_filter(self, wav_file):
+        """
+        Return True if the wav file can contain data of any of the periods of the time filter
+
+        Parameters
+        ----------
+        wav_file : Path or ZipExtFile
+            Sound file
+        """
+        if self.time_filter is None:
+            return True
+        return pathlib.PurePath(wav_file.name).name in self._time_filter_files
+
+    def _update_time_filter_files(self):
+        """
+        Select the files of the time filter, if the folder has been refreshed since the last selection.
+        Has to be called before iterating the folder, as the selection iterates it too
+        """
+        if self.time_filter is not None and self._time_filter_n_refresh != self.acu_files.n_refresh:
+            self._time_filter_files = self._select_time_filter_files()
+            self._time_filter_n_refresh = self.acu_files.n_refresh
+
+    def _select_time_filter_files(self):
+        """
+        Return the set of names of the files which can contain data of any of the periods of the time filter.
+        Only the start date of each file (from the name) is known, so a file is selected if it starts during a
+        period, or if it is the last one starting before the period (it can contain the start of the period).
+        Files with a name that can not be parsed are always selected.
+        """
+        selected = set()
+        files_dates = []
+        # Only the names are needed: the files of a zip are not opened nor extracted
+        for name in self.acu_files.wav_names():
+            try:
+                files_dates.append((self.hydrophone.get_name_datetime(name), name))
+            except ValueError:
+                selected.add(name)
+        files_dates.sort()
+        dates = [date for date, _ in files_dates]
+        for start, end in self.time_filter:
+            first = max(bisect.bisect_right(dates, start) - 1, 0)
+            last = bisect.bisect_right(dates, end)
+            selected.update(name for _, name in files_dates[first:last])
+        return selected
 
     def _hydro_file(self, wav_file):
         """
@@ -131,10 +283,51 @@ class ASA:
         """
         hydro_file = acoustic_file.AcuFile(sfile=wav_file, hydrophone=self.hydrophone, p_ref=self.p_ref,
                                            timezone=self.timezone, channel=self.channel, calibration=self.calibration,
-                                           dc_subtract=self.dc_subtract)
+                                           dc_subtract=self.dc_subtract, dtype=self.dtype,
+                                           fft_workers=self._fft_workers)
         return hydro_file
-    
-    def _get_metadata_attrs(self):
+
+    def _hydro_file_meta(self, wav_file):
+        """
+        Return the date (from the name), number of frames and sampling rate of the wav_file, only reading its header.
+        Much cheaper than creating the AcuFile (no calibration)
+
+        Parameters
+        ----------
+        wav_file : Path or ZipExtFile
+            Sound file
+
+        Returns
+        -------
+        SoundFileMeta (date, frames, samplerate)
+        """
+        info = sf.info(wav_file)
+        if hasattr(wav_file, 'seek'):
+            # File objects (zipped) are reused to create the AcuFile
+            wav_file.seek(0)
+        file_name = pathlib.PurePath(wav_file.name).name
+        try:
+            date = self.hydrophone.get_name_datetime(file_name)
+        except ValueError:
+            # Same as AcuFile
+            date = datetime.datetime.now()
+        return SoundFileMeta(date, info.frames, info.samplerate)
+
+    @property
+    def extra_attrs(self):
+        return self._extra_attrs
+
+    @extra_attrs.setter
+    def extra_attrs(self, extra_attrs):
+        self._extra_attrs = extra_attrs
+        # The cached metadata attributes include the extra attributes
+        self.__dict__.pop('metadata_attrs', None)
+
+    @functools.cached_property
+    def metadata_attrs(self):
+        """
+        Attributes describing the survey, added to all the output datasets. Computed only once (when first accessed)
+        """
         metadata_keys = [
             'binsize',
             'nfft',
@@ -152,17 +345,14 @@ class ASA:
             'hydrophone.Vpp',
         ]
         metadata_attrs = self.extra_attrs.copy()
-        for k in metadata_keys:
-            d = self
-            for sub_k in k.split('.'):
-                d = d.__dict__[sub_k]
+        for k, d in zip(metadata_keys, operator.attrgetter(*metadata_keys)(self)):
             if isinstance(d, pathlib.Path):
                 d = str(d)
             metadata_attrs[k.replace('.', '_')] = d
 
         return metadata_attrs
 
-    def evolution_multiple(self, method_list: list, band_list=None, **kwargs):
+    def evolution_multiple(self, method_list: list, band_list=None, output_zarr=None, **kwargs):
         """
         Compute the method in each file and output the evolution
         Returns a xarray DataSet with datetime as index and one row for each bin of each file
@@ -175,17 +365,20 @@ class ASA:
             Bands to filter. Can be multiple bands (all of them will be analyzed) or only one band. A band is
             represented with a tuple as (low_freq, high_freq). If set to None, the broadband up to the Nyquist
             frequency will be analyzed
+        output_zarr: str, Path or None
+            If given, the output of each file is appended to this zarr store as soon as it is computed, and the
+            returned dataset is lazily loaded from it. Keeps in memory only the output of one file. Requires zarr
         **kwargs :
             Any accepted parameter for the method_name
         """
-        ds = xarray.Dataset(attrs=self._get_metadata_attrs())
         f = operator.methodcaller('_apply_multiple', method_list=method_list, binsize=self.binsize,
                                   nfft=self.nfft, fft_overlap=self.fft_overlap, bin_overlap=self.bin_overlap,
                                   band_list=band_list, **kwargs)
-        for sound_file in self._files():
-            ds_output = f(sound_file)
-            ds = utils.merge_ds(ds, ds_output, self.file_dependent_attrs)
-        return ds
+        if output_zarr is not None:
+            return utils.concat_ds_to_zarr(self._imap_files(f), self.file_dependent_attrs, output_zarr,
+                                           attrs=self.metadata_attrs)
+        ds_list = self._map_files(f)
+        return utils.concat_ds(ds_list, self.file_dependent_attrs, attrs=self.metadata_attrs)
 
     def evolution(self, method_name, band_list=None, **kwargs):
         """
@@ -214,40 +407,32 @@ class ASA:
         -------
         A xarray DataSet with a row per bin with the method name output
         """
-        ds = xarray.Dataset(attrs=self._get_metadata_attrs())
         f = operator.methodcaller(method_name, binsize=self.binsize, nfft=self.nfft, fft_overlap=self.fft_overlap,
                                   bin_overlap=self.bin_overlap, **kwargs)
-        for sound_file in self._files():
-            ds_output = f(sound_file)
-            ds = utils.merge_ds(ds, ds_output, self.file_dependent_attrs)
-        return ds
+        ds_list = self._map_files(f)
+        return utils.concat_ds(ds_list, self.file_dependent_attrs, attrs=self.metadata_attrs)
 
     def timestamps_array(self):
         """
         Return a xarray DataSet with the timestamps of each bin.
         """
-        ds = xarray.Dataset(attrs=self._get_metadata_attrs())
         f = operator.methodcaller('timestamp_da', binsize=self.binsize, bin_overlap=self.bin_overlap)
-        for sound_file in self._files():
-            ds_output = f(sound_file)
-            ds = utils.merge_ds(ds, ds_output, self.file_dependent_attrs)
-        return ds
+        ds_list = [f(sound_file) for sound_file in self._files()]
+        return utils.concat_ds(ds_list, self.file_dependent_attrs, attrs=self.metadata_attrs)
 
     def start_end_timestamp(self):
         """
         Return the start and the end timestamps
         """
         wav_file = self.acu_files[0][0]
-        print(wav_file)
-
-        sound_file = self._hydro_file(wav_file)
-        start_datetime = sound_file.date
+        logger.debug('processing %s', wav_file)
+        start_datetime = self._hydro_file_meta(wav_file).date
 
         file_list = self.acu_files[-1]
         wav_file = file_list[0]
-        print(wav_file)
-        sound_file = self._hydro_file(wav_file)
-        end_datetime = sound_file.date + datetime.timedelta(seconds=sound_file.total_time())
+        logger.debug('processing %s', wav_file)
+        meta = self._hydro_file_meta(wav_file)
+        end_datetime = meta.date + datetime.timedelta(seconds=meta.frames / meta.samplerate)
 
         return start_datetime, end_datetime
 
@@ -265,16 +450,15 @@ class ASA:
         """
         f = operator.methodcaller(method_name, binsize=self.binsize, nfft=self.nfft, fft_overlap=self.fft_overlap,
                                   bin_overlap=self.bin_overlap, **kwargs)
-        for sound_file in self._files():
-            f(sound_file)
+        self._map_files(f)
 
     def duration(self):
         """
-        Return the duration in seconds of all the survey
+        Return the duration in seconds of all the survey (read from the headers of the files)
         """
         total_time = 0
-        for sound_file in self._files():
-            total_time += sound_file.total_time()
+        for _, meta in self._files_meta():
+            total_time += float(meta.frames) / meta.samplerate
 
         return total_time
 
@@ -284,13 +468,21 @@ class ASA:
         Accepts any other input than the correspondent method in the acoustic file.
         Returns the rms value of the whole survey
 
+        The bins are reduced as they are computed (AcuFile.rms_sum_count), so the evolution is never stored
+
         Parameters
         ----------
         **kwargs :
             Any accepted arguments for the rms function of the AcuFile
         """
-        rms_evolution = self.evolution('rms', **kwargs)
-        return rms_evolution['rms'].mean()
+        f = operator.methodcaller('rms_sum_count', binsize=self.binsize, bin_overlap=self.bin_overlap, **kwargs)
+        sums_counts = self._map_files(f)
+        total = sum(s for s, _ in sums_counts)
+        count = sum(n for _, n in sums_counts)
+        # No bins in the survey (i.e. no file in the period)
+        if count == 0:
+            return np.nan
+        return total / count
 
     def spd(self, db=True, h=0.1, percentiles=None, min_val=None, max_val=None):
         """
@@ -357,7 +549,7 @@ class ASA:
         Parameters
         ----------
         period: Tuple or list
-            Tuple or list with (start, stop)
+            Tuple or list with (start, stop). Can be strings in the format YYYY-MM-DD HH:MM:SS or datetime objects
         folder_name: str or Path
             Path to the location of the files to cut
         extensions: list of strings
@@ -365,63 +557,70 @@ class ASA:
         """
         if extensions is None:
             extensions = []
-        start_date = parser.parse(period[0])
-        end_date = parser.parse(period[1])
-        print(start_date, end_date)
+        if isinstance(period[0], datetime.datetime):
+            start_date, end_date = period[0], period[1]
+        else:
+            start_date = parser.parse(period[0])
+            end_date = parser.parse(period[1])
+        logger.info('cutting the files from %s to %s', start_date, end_date)
+        # Compare the metadata logs directly in seconds since epoch (the dates are naive, in UTC)
+        start_unix = pd.Timestamp(start_date).value / 1e9
+        end_unix = pd.Timestamp(end_date).value / 1e9
         folder_path = self.acu_files.folder_path.joinpath(folder_name)
         self.acu_files.extensions = extensions
+        self._update_time_filter_files()
         for file_list in tqdm(self.acu_files):
             wav_file = file_list[0]
+            if not self._is_in_time_filter(wav_file):
+                continue
+            # Only create the AcuFile if the file has to be split or moved
+            meta = self._hydro_file_meta(wav_file)
+            file_end = meta.date + datetime.timedelta(seconds=meta.frames / meta.samplerate)
+            if not ((meta.date < start_date < file_end) or (meta.date < end_date < file_end) or
+                    (start_date <= meta.date <= end_date)):
+                continue
             sound_file = self._hydro_file(wav_file)
-            if sound_file.contains_date(start_date) and sound_file.file.frames > 0:
-                print('start!', wav_file)
+            if sound_file.contains_date(start_date) and sound_file.n_frames > 0:
+                logger.debug('splitting %s at the start of the period', wav_file)
                 # Split the sound file in two files
                 first, second = sound_file.split(start_date)
                 move_file(second, folder_path)
                 # Split the metadata files
                 for i, metadata_file in enumerate(file_list[1:]):
                     if extensions[i] not in ['.log.xml', '.sud', '.bcl', '.dwv']:
-                        ds = pd.read_csv(metadata_file)
-                        ds['datetime'] = pd.to_datetime(ds['unix time'] * 1e9)
-                        ds_first = ds[ds['datetime'] < start_date]
-                        ds_second = ds[ds['datetime'] >= start_date]
-                        ds_first.to_csv(metadata_file)
                         new_metadata_path = second.parent.joinpath(
                             second.name.replace('.wav', extensions[i]))
-                        ds_second.to_csv(new_metadata_path)
+                        split_metadata_file(metadata_file, new_metadata_path, start_unix)
                         # Move the file
                         move_file(new_metadata_path, folder_path)
                     else:
                         move_file(metadata_file, folder_path)
 
             elif sound_file.contains_date(end_date):
-                print('end!', wav_file)
+                logger.debug('splitting %s at the end of the period', wav_file)
                 # Split the sound file in two files
                 first, second = sound_file.split(end_date)
                 move_file(first, folder_path)
                 # Split the metadata files
                 for i, metadata_file in enumerate(file_list[1:]):
                     if extensions[i] not in ['.log.xml', '.sud', '.bcl', '.dwv']:
-                        ds = pd.read_csv(metadata_file)
-                        ds['datetime'] = pd.to_datetime(ds['unix time'] * 1e9)
-                        ds_first = ds[ds['datetime'] < start_date]
-                        ds_second = ds[ds['datetime'] >= start_date]
-                        ds_first.to_csv(metadata_file)
                         new_metadata_path = second.parent.joinpath(
                             second.name.replace('.wav', extensions[i]))
-                        ds_second.to_csv(new_metadata_path)
+                        split_metadata_file(metadata_file, new_metadata_path, end_unix)
                     # Move the file (also if log)
                     move_file(metadata_file, folder_path)
 
             else:
                 if sound_file.is_in_period([start_date, end_date]):
-                    print('moving', wav_file)
+                    logger.debug('moving %s', wav_file)
                     sound_file.file.close()
                     move_file(wav_file, folder_path)
                     for metadata_file in file_list[1:]:
                         move_file(metadata_file, folder_path)
                 else:
                     pass
+        # Files have been split and moved out of the folder
+        self.acu_files.refresh()
         return 0
 
     def detect_piling_events(self, min_separation, max_duration, threshold, dt=None, verbose=False, detection_band=None,
@@ -447,7 +646,7 @@ class ASA:
         verbose : boolean
             Set to True to plot the detected events per bin
         """
-        df = pd.DataFrame()
+        df_list = []
         for sound_file in self._files():
             df_output = sound_file.detect_piling_events(min_separation=min_separation,
                                                         threshold=threshold,
@@ -456,8 +655,8 @@ class ASA:
                                                         detection_band=detection_band,
                                                         analysis_band=analysis_band,
                                                         verbose=verbose, **kwargs)
-            df = pd.concat([df, df_output])
-        return df
+            df_list.append(df_output)
+        return utils.concat_df(df_list)
 
     def detect_ship_events(self, min_duration, threshold, verbose=False):
         """
@@ -472,13 +671,13 @@ class ASA:
         verbose: bool
             Set to True to make plots of the process
         """
-        df = pd.DataFrame()
+        df_list = []
         last_end = None
         detector = loud_event_detector.ShipDetector(min_duration=min_duration,
                                                     threshold=threshold)
         for file_list in tqdm(self.acu_files):
             wav_file = file_list[0]
-            print(wav_file)
+            logger.debug('processing %s', wav_file)
             sound_file = self._hydro_file(wav_file)
             start_datetime = sound_file.date
             end_datetime = sound_file.date + datetime.timedelta(seconds=sound_file.total_time())
@@ -486,13 +685,13 @@ class ASA:
                 if (last_end - start_datetime).total_seconds() < min_duration:
                     detector.reset()
             last_end = end_datetime
-            if sound_file.is_in_period(self.period) and sound_file.file.frames > 0:
+            if sound_file.is_in_period(self.period) and sound_file.n_frames > 0:
                 df_output = sound_file.detect_ship_events(min_duration=min_duration,
                                                           threshold=threshold,
                                                           binsize=self.binsize, detector=detector,
                                                           verbose=verbose)
-                df = pd.concat([df, df_output])
-        return df
+                df_list.append(df_output)
+        return utils.concat_df(df_list)
 
     def source_separation(self, window_time=1.0, n_sources=15, save_path=None, verbose=False, band=None):
         """
@@ -510,13 +709,13 @@ class ASA:
         band : tuple or list
             Tuple or list with two elements: low-cut and high-cut of the band to analyze
         """
-        ds = xarray.Dataset(attrs=self._get_metadata_attrs())
+        ds_list = []
         for sound_file in self._files():
             nmf_ds = sound_file.source_separation(window_time, n_sources, binsize=self.binsize, band=band,
                                                   save_path=save_path, verbose=verbose)
-            ds = utils.merge_ds(ds, nmf_ds, self.file_dependent_attrs)
+            ds_list.append(nmf_ds)
 
-        return ds
+        return utils.concat_ds(ds_list, self.file_dependent_attrs, attrs=self.metadata_attrs)
 
     def plot_rms_evolution(self, db=True, save_path=None):
         """
@@ -592,9 +791,13 @@ class ASA:
         daily_xr = ds.swap_dims(id='datetime')
         daily_xr = daily_xr.sortby('datetime')
 
-        hours_float = daily_xr.datetime.dt.hour + daily_xr.datetime.dt.minute / 60
-        date_minute_index = pd.MultiIndex.from_arrays([daily_xr.datetime.dt.floor('D').values,
-                                                       hours_float.values],
+        # Floor to the day and to the minute directly on the int64 nanoseconds
+        ns = daily_xr.datetime.values.astype('datetime64[ns]').astype(np.int64)
+        day_ns = (ns // DAY_NS) * DAY_NS
+        minutes = (ns - day_ns) // MINUTE_NS
+        hours_float = minutes // 60 + (minutes % 60) / 60
+        date_minute_index = pd.MultiIndex.from_arrays([day_ns.astype('datetime64[ns]'),
+                                                       hours_float],
                                                       names=('date', 'time'))
         daily_xr = daily_xr.assign(datetime=date_minute_index).unstack('datetime')
 
@@ -759,12 +962,34 @@ class ASA:
         """
 
 
+# ASA and function of the process, set by _init_worker when the processes of ASA._imap_files start
+_worker_asa = None
+_worker_f = None
+
+
+def _init_worker(asa, f):
+    """
+    Store the ASA and the function to apply in the process, so they are sent only once to each process
+    """
+    global _worker_asa, _worker_f
+    _worker_asa = asa
+    _worker_f = f
+
+
+def _apply_to_file(wav_file):
+    """
+    Apply the function of the process to the AcuFile of wav_file, created with the parameters of its ASA.
+    Used by the parallel processes of ASA
+    """
+    return _worker_f(_worker_asa._hydro_file(wav_file))
+
+
 class AcousticFolder:
     """
     Class to help through the iterations of the acoustic folder.
     """
 
-    def __init__(self, folder_path, zipped=False, include_dirs=False, extensions=None):
+    def __init__(self, folder_path, zipped=False, include_dirs=False, extensions=None, extract_workers=None):
         """
         Store the information about the folder.
         It will create an iterator that returns all the pairs of extensions having the same name than the wav file
@@ -780,52 +1005,244 @@ class AcousticFolder:
         extensions : list
             List of strings with all the extensions that will be returned (.wav is automatic)
             i.e. extensions=['.xml', '.bcl'] will return [wav, xml and bcl] files
+        extract_workers : int or None
+            Only for a zip file (zipped and not include_dirs). If None, the files are read directly from the zip. If
+            an int, the files are first extracted to a temporary folder with this number of threads (the members are
+            decompressed in parallel), and the paths of the extracted files are returned.
+            i.e. extract_workers=min(32, os.cpu_count() * 2)
         """
         self.folder_path = pathlib.Path(folder_path)
         if not self.folder_path.exists():
             raise FileNotFoundError('The path %s does not exist. Please choose another one.' % folder_path)
-        if len(list(self.folder_path.glob('**/*.wav'))) == 0:
-            raise ValueError('The directory %s is empty. Please select another directory with *.wav files' %
-                             folder_path)
         self.zipped = zipped
         self.recursive = include_dirs
         if extensions is None:
             extensions = []
         self.extensions = extensions
+        self.extract_workers = extract_workers
+        # Sorted list of the wav files, scanned only once (see refresh)
+        self._files_list = None
+        # Number of times the folder has been refreshed, so the selections made from its files can be updated
+        self.n_refresh = 0
+        # Temporary folder with the extracted files, and the names of the members already extracted
+        self._extract_dir = None
+        self._extracted = set()
+        if self.zipped and not self.recursive:
+            # The zip file is opened once, and its list of members is kept
+            self._open_zip()
+        # The checks of the folders stop at the first wav file found, the complete list is only built when it is needed.
+        # Folders are checked with their subfolders, also if they are not included.
+        # The names of the zip file are already in memory, so its list of wav files is filtered once and kept
+        if not self.zipped or self.recursive:
+            is_empty = next(self.folder_path.rglob('*.wav'), None) is None
+        else:
+            is_empty = len(self._get_files_list()) == 0
+        if is_empty:
+            raise ValueError('The directory %s is empty. Please select another directory with *.wav files' %
+                             folder_path)
+
+    def _get_files_list(self):
+        """
+        Return the sorted list of wav files of the folder (or of the zip file). The folder is scanned the first time
+        and the list is reused by the following iterations (and by len)
+        """
+        if self._files_list is None:
+            if not self.zipped:
+                self._files_list = self._scan_wavs()
+            else:
+                self._files_list = [f for f in self._names if f.endswith('.wav')]
+        return self._files_list
+
+    def _scan_wavs(self):
+        """
+        Return the sorted list of paths of the wav files of the folder (and of its subfolders if recursive)
+        """
+        return sorted(self._iter_wavs())
+
+    def _iter_wavs(self):
+        """
+        Yield the paths of the wav files of the folder (and of its subfolders if recursive), unsorted.
+        The folders are walked with os.scandir, which gives the type of each entry without an extra stat
+        """
+        folders = [self.folder_path]
+        while len(folders) > 0:
+            with os.scandir(folders.pop()) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.wav') and entry.is_file():
+                        yield pathlib.Path(entry.path)
+                    elif self.recursive and entry.is_dir(follow_symlinks=False):
+                        folders.append(entry.path)
+
+    def _sibling_names(self, wav_name):
+        """
+        Return the names of the files with the same name as the wav file, with each of the extensions
+
+        Parameters
+        ----------
+        wav_name : str
+            Path or zip member name of the wav file
+        """
+        # Only the suffix is replaced (.wav could also be part of the name of a folder)
+        stem = wav_name[:-len('.wav')]
+        return [stem + extension for extension in self.extensions]
+
+    def _open_zip(self):
+        """
+        Open the zip file and store the names of its members (as a list and as a set for the lookups)
+        """
+        self._zf = zipfile.ZipFile(self.folder_path, 'r', allowZip64=True)
+        self._names = self._zf.namelist()
+        self._names_set = set(self._names)
+
+    def close(self):
+        """
+        Close the zip file (if any)
+        """
+        if self.zipped and not self.recursive:
+            self._zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        # The open zip file can't be pickled (i.e. to send the ASA to other processes). It is opened again
+        state = self.__dict__.copy()
+        state.pop('_zf', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.zipped and not self.recursive:
+            self._open_zip()
+
+    def refresh(self):
+        """
+        Forget the list of files, so the folder is scanned again in the next iteration.
+        Has to be called if files are added, moved or removed from the folder
+        """
+        self._files_list = None
+        self.n_refresh += 1
+
+    def _extract_files(self, file_names=None):
+        """
+        Extract the wav files of the zip file (and the files with the same name and the desired extensions) which
+        have not been extracted yet. The members are extracted in parallel with extract_workers threads
+
+        Parameters
+        ----------
+        file_names : list of str or None
+            Names of the wav members to extract. If None, all the wav files are extracted
+        """
+        if self._extract_dir is None:
+            self._extract_dir = tempfile.TemporaryDirectory()
+        if file_names is None:
+            file_names = self._get_files_list()
+        to_extract = []
+        for file_name in file_names:
+            for name in [file_name] + self._sibling_names(file_name):
+                if name in self._names_set and name not in self._extracted:
+                    to_extract.append(name)
+        # The folders are created first, one after the other, so the threads never race to create the same folder.
+        # Then the ZipFile is shared: each member is opened with its own file pointer and copied to its path
+        targets = [self._extract_path(name) for name in to_extract]
+        for folder in set(target.parent for target in targets):
+            folder.mkdir(parents=True, exist_ok=True)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.extract_workers) as executor:
+            list(executor.map(self._extract_member, to_extract, targets))
+        self._extracted.update(to_extract)
+
+    def _extract_path(self, name):
+        """
+        Return the path where the member is extracted. As in ZipFile.extract, the member can not be written outside
+        of the extraction folder (no absolute paths and no parent folders)
+
+        Parameters
+        ----------
+        name : str
+            Name of the member in the zip file
+        """
+        parts = [part for part in name.split('/') if part not in ('', '.', '..')]
+        return pathlib.Path(self._extract_dir.name).joinpath(*parts)
+
+    def _extract_member(self, name, target):
+        """
+        Copy the content of the member to the target path (its folder has to exist)
+
+        Parameters
+        ----------
+        name : str
+            Name of the member in the zip file
+        target : Path
+            Path of the extracted file
+        """
+        with self._zf.open(name) as member, open(target, 'wb') as f:
+            shutil.copyfileobj(member, f)
+
+    def wav_names(self):
+        """
+        Return the names (without the folders) of all the wav files, without opening or extracting them
+        """
+        if self.zipped and self.recursive:
+            return [pathlib.PurePath(file_list[0].name).name for file_list in self]
+        return [pathlib.PurePath(file_name).name for file_name in self._get_files_list()]
 
     def __getitem__(self, n):
         """
         Get n wav file
         """
-        self.__iter__()
-        self.n = n
-        return self.__next__()
+        if self.zipped and self.recursive:
+            self.__iter__()
+            self.n = n
+            return self.__next__()
+        # Direct access to the cached list, without changing the state of the iteration
+        file_name = self._get_files_list()[n]
+        if self.zipped and self.extract_workers is not None:
+            self._extract_files([file_name])
+        return self._file_group(file_name)
+
+    def _file_group(self, file_name):
+        """
+        Return the list with the wav file and the files with the same name and the desired extensions.
+        Paths for a folder (or an extracted zip), and open members for a zip file
+
+        Parameters
+        ----------
+        file_name : Path or str
+            Path of the wav file, or name of the wav member in the zip file
+        """
+        files_list = []
+        if not self.zipped:
+            files_list.append(file_name)
+            for ext_file_name in self._sibling_names(str(file_name)):
+                files_list.append(pathlib.Path(ext_file_name))
+        elif self.extract_workers is not None:
+            files_list.append(self._extract_path(file_name))
+            for ext_file_name in self._sibling_names(file_name):
+                files_list.append(self._extract_path(ext_file_name))
+        else:
+            files_list.append(self._zf.open(file_name))
+            for ext_file_name in self._sibling_names(file_name):
+                files_list.append(self._zf.open(ext_file_name))
+        return files_list
 
     def __iter__(self):
         """
         Iteration
         """
         self.n = 0
-        if not self.zipped:
-            if self.recursive:
-                self.files_list = sorted(self.folder_path.glob('**/*.wav'))
-            else:
-                self.files_list = sorted(self.folder_path.glob('*.wav'))
+        if self.zipped and self.recursive:
+            self.folder_list = sorted(self.folder_path.iterdir())
+            self.zipped_subfolder = AcousticFolder(self.folder_list[self.n],
+                                                   extensions=self.extensions,
+                                                   zipped=self.zipped,
+                                                   include_dirs=self.recursive)
         else:
-            if self.recursive:
-                self.folder_list = sorted(self.folder_path.iterdir())
-                self.zipped_subfolder = AcousticFolder(self.folder_list[self.n],
-                                                       extensions=self.extensions,
-                                                       zipped=self.zipped,
-                                                       include_dirs=self.recursive)
-            else:
-                zipped_folder = zipfile.ZipFile(self.folder_path, 'r', allowZip64=True)
-                self.files_list = []
-                total_files_list = zipped_folder.namelist()
-                for f in total_files_list: 
-                    extension = f.split(".")[-1]
-                    if extension == 'wav':
-                        self.files_list.append(f)
+            self.files_list = self._get_files_list()
+            if self.zipped and self.extract_workers is not None:
+                self._extract_files()
         return self
 
     def __next__(self):
@@ -833,54 +1250,91 @@ class AcousticFolder:
         Next wav file
         """
         if self.n < len(self.files_list):
-            files_list = []
-            if self.zipped:
-                if self.recursive:
-                    try:
-                        self.files_list = self.zipped_subfolder.__next__()
-                    except StopIteration:
-                        self.n += 1
-                        self.zipped_subfolder = AcousticFolder(self.folder_list[self.n],
-                                                               extensions=self.extensions,
-                                                               zipped=self.zipped,
-                                                               include_dirs=self.recursive)
-                else:
-                    file_name = self.files_list[self.n]
-                    zipped_folder = zipfile.ZipFile(self.folder_path, 'r', allowZip64=True)
-                    wav_file = zipped_folder.open(file_name)
-                    files_list.append(wav_file)
-                    for extension in self.extensions:
-                        ext_file_name = file_name.parent.joinpath(
-                            file_name.name.replace('.wav', extension))
-                        files_list.append(zipped_folder.open(ext_file_name))
+            if self.zipped and self.recursive:
+                try:
+                    self.files_list = self.zipped_subfolder.__next__()
+                except StopIteration:
                     self.n += 1
-                    return files_list
+                    self.zipped_subfolder = AcousticFolder(self.folder_list[self.n],
+                                                           extensions=self.extensions,
+                                                           zipped=self.zipped,
+                                                           include_dirs=self.recursive)
             else:
-                wav_path = self.files_list[self.n]
-                files_list.append(wav_path)
-                for extension in self.extensions:
-                    files_list.append(pathlib.Path(str(wav_path).replace('.wav', extension)))
-
+                files_list = self._file_group(self.files_list[self.n])
                 self.n += 1
                 return files_list
         else:
             raise StopIteration
 
+    def imap(self, fn, max_workers=None):
+        """
+        Apply fn to the list of files of each wav file (as returned by the iteration) in parallel processes, and
+        yield the outputs in the order of the files.
+        The members of a zip file are read in this process (one after the other) and sent to the workers in memory,
+        as the open zip file can't be shared. Only a few files per worker are read in advance
+
+        Parameters
+        ----------
+        fn : callable
+            Function receiving the list of files of a wav file. It has to be picklable (i.e. defined at module level)
+        max_workers : int or None
+            Number of processes. If None, the number of cpus
+        """
+        if max_workers is None:
+            max_workers = os.cpu_count()
+        pending = collections.deque()
+        # Spawn the processes: forking after the numba threads have been started can deadlock
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers,
+                                                    mp_context=multiprocessing.get_context('spawn')) as executor:
+            for files_list in self:
+                pending.append(executor.submit(fn, [_in_memory(f) for f in files_list]))
+                if len(pending) > 2 * max_workers:
+                    yield pending.popleft().result()
+            while len(pending) > 0:
+                yield pending.popleft().result()
+
     def __len__(self):
-        if not self.zipped:
-            if self.recursive:
-                n_files = len(list(self.folder_path.glob('**/*.wav')))
-            else:
-                n_files = len(list(self.folder_path.glob('*.wav')))
+        if self.zipped and self.recursive:
+            n_files = len(list(self.folder_path.iterdir()))
         else:
-            if self.recursive:
-                n_files = len(list(self.folder_path.iterdir()))
-            else:
-                zipped_folder = zipfile.ZipFile(self.folder_path, 'r', allowZip64=True)
-                n_files = len(zipped_folder.namelist())
+            n_files = len(self._get_files_list())
         return n_files
 
 
+def _in_memory(f):
+    """
+    Return the content of an open zip member as a BytesIO (with the same name), which can be sent to other processes.
+    Paths are returned as they are
+    """
+    if not isinstance(f, zipfile.ZipExtFile):
+        return f
+    with f:
+        content = io.BytesIO(f.read())
+    content.name = f.name
+    return content
+
+
+def split_metadata_file(metadata_file, new_metadata_path, split_unix):
+    """
+    Split a csv metadata log in two files: the rows before split_unix stay in metadata_file, and the rest are
+    written to new_metadata_path
+
+    Parameters
+    ----------
+    metadata_file : string or Path
+        Metadata csv file, with a 'unix time' column (in seconds)
+    new_metadata_path : string or Path
+        Path of the csv file with the second part of the log
+    split_unix : float
+        Time (in seconds since epoch) where to split the log
+    """
+    ds = pd.read_csv(metadata_file)
+    # The log is sorted in time, so it can be split by position
+    split = np.searchsorted(ds['unix time'].values, split_unix)
+    ds.iloc[:split].to_csv(metadata_file)
+    ds.iloc[split:].to_csv(new_metadata_path)
+
+
 def move_file(file_path, new_folder_path):
     """
     Move the file to the new folder
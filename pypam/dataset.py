@@ -1,3 +1,5 @@
+import concurrent.futures
+import multiprocessing
 import pathlib
 
 import matplotlib.pyplot as plt
@@ -42,14 +44,25 @@ class DataSet:
          In seconds, duration of windows to consider
      nfft : int
          Number of samples of window to use for frequency analysis
+     dtype : string or numpy dtype
+         Data type used to read the sound files ('float64' or 'float32')
+     n_workers : int
+         Number of processes used to generate the deployments in parallel. Each deployment is computed in a separate
+         process, so it only makes sense when there are several deployments to generate
      """
 
     def __init__(self, summary_path, output_folder, instruments, temporal_features=None, frequency_features=None,
-                 bands_list=None, binsize=60.0, bin_overlap=0.0, nfft=512, fft_overlap=0, dc_subtract=False):
+                 bands_list=None, binsize=60.0, bin_overlap=0.0, nfft=512, fft_overlap=0, dc_subtract=False,
+                 dtype='float64', n_workers=1):
         self.metadata = pd.read_csv(summary_path)
         if 'end_to_end_calibration' not in self.metadata.columns:
             self.metadata['end_to_end_calibration'] = np.nan
         self.summary_path = summary_path
+        # Check all the instruments once, instead of failing when reaching the deployment
+        missing_instruments = set(self.metadata['instrument_name']) - set(instruments.keys())
+        if len(missing_instruments) > 0:
+            raise ValueError('The instruments %s are in the metadata but not in the instruments dictionary' %
+                             sorted(missing_instruments))
         self.instruments = instruments
         self.temporal_features = temporal_features
         self.frequency_features = frequency_features
@@ -59,6 +72,8 @@ class DataSet:
         self.nfft = nfft
         self.fft_overlap = fft_overlap
         self.dc_subtract = dc_subtract
+        self.dtype = dtype
+        self.n_workers = n_workers
 
         if not isinstance(output_folder, pathlib.Path):
             output_folder = pathlib.Path(output_folder)
@@ -83,6 +98,14 @@ class DataSet:
         Also adds all the deployment data to the self object in the general dataset,
         and the path to each deployment's pickle in the list of deployments
         """
+        if self.n_workers > 1:
+            # Generate the missing deployments in parallel, the results are loaded from the saved files below.
+            # Workers are spawned: forking after the numba threads have been started can deadlock
+            missing = [idx for idx, name, deployment_path in self.deployments() if not deployment_path.exists()]
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.n_workers,
+                                                        mp_context=multiprocessing.get_context('spawn')) as executor:
+                for idx, calibration in zip(missing, executor.map(self._save_deployment, missing)):
+                    self.metadata.loc[idx, 'end_to_end_calibration'] = calibration
         for idx, name, deployment_path in self.deployments():
             self[idx]
         self.metadata.to_csv(self.summary_path, index=False)
@@ -107,11 +130,8 @@ class DataSet:
         return idx, deployment_row['deployment_name'], deployment_path
 
     def join_dataset(self):
-        ds = xarray.Dataset()
-        for idx, name, deployment_path, in self.deployments():
-            deployment = self[idx]
-            ds = utils.merge_ds(ds, deployment, self.survey_dependent_attrs)
-        return ds
+        deployments = [self[idx] for idx, name, deployment_path, in self.deployments()]
+        return utils.concat_ds(deployments, self.survey_dependent_attrs)
 
     def deployments(self):
         """
@@ -137,6 +157,28 @@ class DataSet:
         -------
         ds: xarray Dataset
         """
+        ds, end_to_end_calibration = self._compute_deployment(idx)
+
+        # Update the metadata in case the calibration changed the sensitivity
+        self.metadata.loc[idx, 'end_to_end_calibration'] = end_to_end_calibration
+        self.metadata.to_csv(self.summary_path, index=False)
+        return ds
+
+    def _save_deployment(self, idx):
+        """
+        Compute the deployment and save it to its netcdf file. Used by the parallel workers, which can't update the
+        metadata of the main process, so the end to end calibration is returned instead
+        """
+        _, _, deployment_path = self._deployment(idx)
+        ds, end_to_end_calibration = self._compute_deployment(idx)
+        ds.to_netcdf(deployment_path)
+        return end_to_end_calibration
+
+    def _compute_deployment(self, idx):
+        """
+        Compute the features of the deployment, without modifying the metadata.
+        Returns the dataset and the end to end calibration of the hydrophone
+        """
         hydrophone = self.instruments[self.metadata.loc[(idx, 'instrument_name')]]
         hydrophone.sensitivity = self.metadata.loc[(idx, 'instrument_sensitivity')]
         hydrophone.preamp_gain = self.metadata.loc[(idx, 'instrument_amp')]
@@ -149,6 +191,7 @@ class DataSet:
                                   nfft=self.nfft,
                                   fft_overlap=self.fft_overlap,
                                   extra_attrs=extra_attrs,
+                                  dtype=self.dtype,
                                   **self.metadata.loc[(idx, survey_columns)].to_dict())
         ds = xarray.Dataset()
         if self.frequency_features not in [[], None]:
@@ -161,10 +204,7 @@ class DataSet:
             for f in self.temporal_features:
                 ds = ds.merge(temporal_evo[f])
 
-        # Update the metadata in case the calibration changed the sensitivity
-        self.metadata.loc[idx, 'end_to_end_calibration'] = hydrophone.end_to_end_calibration(p_ref=1.0)
-        self.metadata.to_csv(self.summary_path, index=False)
-        return ds
+        return ds, hydrophone.end_to_end_calibration(p_ref=1.0)
 
     def add_deployment_metadata(self, idx):
         deployment_row = self.metadata.iloc[idx]
@@ -58,21 +58,41 @@ class Detection(sig.Signal):
         self.start_seconds = start_seconds
         self.end_seconds = end_seconds
 
-        self.frame_init = int(self.acu_file.fs * self.start_seconds)
-        self.frame_end = int(self.acu_file.fs * self.end_seconds)
+        fs = self.acu_file.fs
+        self.frame_init = int(fs * self.start_seconds)
+        self.frame_end = int(fs * self.end_seconds)
 
         self.frames = self.frame_end - self.frame_init
 
         self.duration = self.end_seconds - self.start_seconds
 
-        wav_sig, fs = sf.read(self.acu_file.file_path, start=self.frame_init, stop=min(self.frame_end,
-                                                                                       self.acu_file.file.frames))
+        self.orig_fs = self.acu_file.file.samplerate
+        # Read the signal and convert it to upa in place, so only one buffer of the detection is allocated
+        signal_upa = self._read_wav(dtype=self.acu_file.dtype)
+        signal_upa *= signal_upa.dtype.type(self.acu_file.upa_gain())
+        super().__init__(signal=signal_upa, fs=fs, channel=self.acu_file.channel)
 
-        self.orig_wav = wav_sig
-        self.orig_fs = fs
-        # Read the signal and prepare it for analysis
-        signal_upa = self.acu_file.wav2upa(wav=wav_sig)
-        super().__init__(signal=signal_upa, fs=self.acu_file.fs, channel=self.acu_file.channel)
+    @property
+    def orig_wav(self):
+        """
+        Original wav signal of the detection (-1 to 1). It is read again from the file, so it is not kept in memory
+        """
+        return self._read_wav()
+
+    def _read_wav(self, dtype='float64'):
+        """
+        Read the detection from the sound file already opened by the AcuFile (instead of opening it again)
+
+        Parameters
+        ----------
+        dtype : str
+            Data type of the returned signal
+        """
+        self.acu_file.file.seek(self.frame_init)
+        wav = self.acu_file.file.read(frames=min(self.frame_end, self.acu_file.n_frames) - self.frame_init,
+                                      dtype=dtype)
+        self.acu_file.file.seek(0)
+        return wav
 
     def save_clip(self, clip_path):
         """
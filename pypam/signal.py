@@ -9,6 +9,7 @@ import operator
 import matplotlib.pyplot as plt
 import noisereduce as nr
 import numpy as np
+import scipy.fft
 import scipy.signal as sig
 import seaborn as sns
 import sklearn.linear_model as linear_model
@@ -27,7 +28,7 @@ MIN_FREQ = 1
 
 
 class Signal:
-    def __init__(self, signal, fs, channel=0):
+    def __init__(self, signal, fs, channel=0, fft_workers=-1):
         """
         Representation of a signal
         Parameters
@@ -38,9 +39,12 @@ class Signal:
             Sample rate
         channel : int
             Channel to perform the calculations in
+        fft_workers : int
+            Number of threads used by scipy.fft to compute the spectrum and the spectrogram. -1 uses all the cpus
         """
         # Original signal
         self._fs = fs
+        self.fft_workers = fft_workers
         if len(signal.shape) > 1:
             signal = signal[:, channel]
         self._signal = signal.copy()
@@ -376,14 +380,14 @@ class Signal:
         for i in np.arange(1, nx + 1):
             newx[i] = sig.decimate(newx[i - 1], 2)
 
-        # Perform filtering for each frequency band
-        for i in np.arange(len(d)):
-            y = sig.sosfilt(filterbank[i], newx[d[i]])  # Check the filter!
-            # Calculate level time series
-            if db:
-                spg[i] = 10 * np.log10(np.sum(y ** 2) / len(y))
-            else:
-                spg[i] = y
+        # Perform filtering for all the frequency bands sharing the same downsampled signal at once
+        for level in np.unique(d):
+            group = d == level
+            x = np.ascontiguousarray(newx[level], dtype=np.float64)
+            spg[group] = utils.sosfilt_bank_sum_squares(filterbank[group], x) / x.size  # Check the filter!
+        # Calculate level time series
+        if db:
+            spg = 10 * np.log10(spg)
 
         return f, spg
 
@@ -407,9 +411,12 @@ class Signal:
         real_size = self.signal.size
         if self.signal.size < nfft:
             self.fill_or_crop(n_samples=nfft)
-        window = sig.get_window('hann', nfft)
+        window = utils.get_window('hann', nfft)
         noverlap = overlap * nfft
-        freq, t, sxx = sig.spectrogram(self.signal, fs=self.fs, nfft=nfft, window=window, scaling=scaling, noverlap=noverlap)
+        # Let scipy.fft transform the frames in parallel
+        with scipy.fft.set_workers(self.fft_workers):
+            freq, t, sxx = sig.spectrogram(self.signal, fs=self.fs, nfft=nfft, window=window, scaling=scaling,
+                                           noverlap=noverlap)
         if self.band is not None:
             if self.band[0] is None:
                 low_freq = 0
@@ -473,9 +480,13 @@ class Signal:
         noverlap = nfft * overlap
         if nfft > self.signal.size:
             self.fill_or_crop(n_samples=nfft)
-        window = sig.get_window(window_name, nfft)
-        freq, psd = sig.welch(self.signal, fs=self.fs, window=window, nfft=nfft, scaling=scaling, noverlap=noverlap,
-                              detrend=False, **kwargs)
+        window = utils.get_window(window_name, nfft)
+        if kwargs:
+            freq, psd = sig.welch(self.signal, fs=self.fs, window=window, nfft=nfft, scaling=scaling,
+                                  noverlap=noverlap, detrend=False, **kwargs)
+        else:
+            freq, psd = utils.welch(self.signal, fs=self.fs, window=window, noverlap=noverlap, scaling=scaling,
+                                    workers=self.fft_workers)
         if self.band is not None and self.band[0] is not None:
             low_freq = np.argmax(freq >= self.band[0])
         else:
@@ -903,10 +914,16 @@ class Signal:
         for i in np.arange(1, nx):
             newx[i] = sig.decimate(newx[i - 1], 2)
 
-        # Perform filtering for each frequency band
+        # Perform filtering for all the frequency bands sharing the same downsampled signal at once
+        y_bands = [None] * len(d)
+        for level in np.unique(d):
+            group = np.flatnonzero(d == level)
+            y_group = utils.sosfilt_bank(filterbank[group], np.ascontiguousarray(newx[level], dtype=np.float64))
+            for j, y in zip(group, y_group):
+                y_bands[j] = y
         for j in np.arange(len(d)):
-            factor = 2 ** (d(j) - 1)
-            y = sig.sosfilt(filterbank[j], newx[d(j)])
+            factor = 2 ** (d[j] - 1)
+            y = y_bands[j]
             # Calculate level time series
             for k in np.arange(nt):
                 startindex = (k - 1) * n / factor + 1
@@ -4,9 +4,13 @@ __credits__ = "Clea Parcerisas"
 __email__ = "clea.parcerisas@vliz.be"
 __status__ = "Development"
 
+import functools
+
 import numba as nb
 import numpy as np
+import scipy.fft
 import scipy.signal as sig
+import scipy.sparse as sparse
 import xarray
 import pandas as pd
 import pathlib
@@ -16,7 +20,7 @@ G = 10.0 ** (3.0 / 10.0)
 f_ref = 1000
 
 
-@nb.jit
+@nb.njit(parallel=True, cache=True)
 def sxx2spd(sxx: np.ndarray, h: float, percentiles: np.ndarray, bin_edges: np.ndarray):
     """
     Return spd from the spectrogram
@@ -32,17 +36,175 @@ def sxx2spd(sxx: np.ndarray, h: float, percentiles: np.ndarray, bin_edges: np.nd
     bin_edges : numpy array
         Limits of the histogram bins
     """
-    spd = np.zeros((sxx.shape[0], bin_edges.size - 1), dtype=np.float64)
+    n_bins = bin_edges.size - 1
+    spd = np.zeros((sxx.shape[0], n_bins), dtype=np.float64)
     p = np.zeros((sxx.shape[0], percentiles.size), dtype=np.float64)
+    norm = sxx.shape[1] * h
+    first_edge = bin_edges[0]
+    last_edge = bin_edges[n_bins]
+    scale = n_bins / (last_edge - first_edge)
     for i in nb.prange(sxx.shape[0]):
-        spd[i, :] = np.histogram(sxx[i, :], bin_edges)[0] / ((sxx.shape[1]) * h)
+        # Histogram of the row (same bins as np.histogram: the last bin includes its upper edge)
+        counts = np.zeros(n_bins, dtype=np.int64)
+        for t in range(sxx.shape[1]):
+            v = sxx[i, t]
+            if first_edge <= v <= last_edge:
+                # Bin of equally spaced edges, corrected with the actual edges (rounding)
+                k = min(int((v - first_edge) * scale), n_bins - 1)
+                while k > 0 and v < bin_edges[k]:
+                    k -= 1
+                while k < n_bins - 1 and v >= bin_edges[k + 1]:
+                    k += 1
+                counts[k] += 1
+        spd[i, :] = counts / norm
         cumsum = np.cumsum(spd[i, :])
-        for j in nb.prange(percentiles.size):
-            p[i, j] = bin_edges[np.argmax(cumsum > percentiles[j] * cumsum[-1])]
+        # First bin where the cumulative sum exceeds each percentile (the first bin if there is none)
+        k = np.searchsorted(cumsum, percentiles * cumsum[-1], side='right')
+        k[k == n_bins] = 0
+        p[i, :] = bin_edges[k]
 
     return spd, p
 
 
+@nb.njit(parallel=True, cache=True)
+def sxx_percentiles(sxx: np.ndarray, percentiles: np.ndarray, bin_edges: np.ndarray):
+    """
+    Return the same percentiles as sxx2spd, without computing the histogram. Each row is sorted once and the
+    percentiles are read from the sorted values, snapped to the lower edge of their bin. A percentile falling exactly
+    on a boundary between values is resolved with the exact counts, while sxx2spd can be one bin off there because of
+    the rounding of its normalized cumulative sum
+
+    Parameters
+    ----------
+    sxx : numpy matrix
+        Spectrogram
+    percentiles : numpy array
+        All the percentiles to be computed, as fractions (0 to 1)
+    bin_edges : numpy array
+        Limits of the histogram bins
+    """
+    n_bins = bin_edges.size - 1
+    p = np.zeros((sxx.shape[0], percentiles.size), dtype=np.float64)
+    for i in nb.prange(sxx.shape[0]):
+        row = sxx[i]
+        # Only the values inside the histogram are counted
+        values = np.sort(row[(row >= bin_edges[0]) & (row <= bin_edges[n_bins])])
+        for j in range(percentiles.size):
+            # The first bin where the cumulative count exceeds the percentile is the bin of the m-th value
+            m = int(np.floor(percentiles[j] * values.size)) + 1
+            k = 0
+            if 1 <= m <= values.size:
+                k = min(np.searchsorted(bin_edges, values[m - 1], side='right') - 1, n_bins - 1)
+            p[i, j] = bin_edges[k]
+
+    return p
+
+
+@functools.lru_cache(maxsize=16)
+def get_window(window_name, nfft):
+    """
+    Return the window of length nfft. The windows are cached, as they are the same for all the bins of a survey.
+    The returned array is read-only, copy it before modifying it
+
+    Parameters
+    ----------
+    window_name : str or tuple
+        Name of the window, as accepted by scipy.signal.get_window
+    nfft : int
+        Length of the window in samples
+    """
+    window = sig.get_window(window_name, nfft)
+    window.flags.writeable = False
+    return window
+
+
+def welch(signal, fs, window, noverlap=0, scaling='density', batch_size=256, workers=-1):
+    """
+    Return the one-sided averaged periodogram (Welch method, mean average and no detrending) of the signal.
+    The frames are windowed, transformed and squared in batches of batch_size frames, accumulating the power in
+    a single spectrum, so the complex spectrogram of the whole signal is never held in memory.
+
+    Parameters
+    ----------
+    signal : numpy array
+        Signal to compute the spectrum of
+    fs : int
+        Sampling frequency
+    window : numpy array
+        Window to apply to each frame. The length of the window is used as nfft
+    noverlap : int or float
+        Number of samples to overlap between frames
+    scaling : string
+        Can be set to 'spectrum' or 'density' depending on the desired output
+    batch_size : int
+        Number of frames transformed at once
+    workers : int
+        Number of threads used by scipy.fft to transform the frames of a batch. -1 uses all the cpus
+
+    Returns
+    -------
+    freq, psd
+    """
+    nfft = window.size
+    window = window.astype(signal.dtype, copy=False)
+    noverlap = int(noverlap)
+    step = nfft - noverlap
+    n_frames = (signal.size - noverlap) // step
+    frames = np.lib.stride_tricks.sliding_window_view(signal, nfft)[::step][:n_frames]
+    psd = np.zeros(nfft // 2 + 1)
+    for start in np.arange(0, n_frames, batch_size):
+        spec = scipy.fft.rfft(frames[start:start + batch_size] * window, n=nfft, axis=-1, workers=workers)
+        psd += np.sum(spec.real ** 2 + spec.imag ** 2, axis=0)
+    if scaling == 'density':
+        scale = 1.0 / (fs * np.sum(window * window))
+    elif scaling == 'spectrum':
+        scale = 1.0 / np.sum(window) ** 2
+    else:
+        raise ValueError('Unknown scaling: %r' % scaling)
+    psd *= scale / n_frames
+    # One-sided spectrum: double all the bins except the DC and the Nyquist (if it exists)
+    if nfft % 2:
+        psd[1:] *= 2
+    else:
+        psd[1:-1] *= 2
+    freq = scipy.fft.rfftfreq(nfft, 1 / fs)
+    return freq, psd.astype(signal.dtype, copy=False)
+
+
+@nb.njit(parallel=True, fastmath=True, cache=True)
+def sum_squares(signal):
+    """
+    Return the sum of the squared samples of the signal, in a single pass without creating signal ** 2
+
+    Parameters
+    ----------
+    signal : numpy array
+        Signal to compute the sum of squares
+    """
+    s = 0.0
+    for i in nb.prange(signal.size):
+        s += signal[i] * signal[i]
+    return s
+
+
+@nb.njit(parallel=True, fastmath=True, cache=True)
+def max_min(signal):
+    """
+    Return the maximum and the minimum of the signal, in a single pass without creating np.abs(signal)
+
+    Parameters
+    ----------
+    signal : numpy array
+        Signal to compute the maximum and the minimum
+    """
+    hi = signal[0]
+    lo = signal[0]
+    for i in nb.prange(signal.size):
+        hi = max(hi, signal[i])
+        lo = min(lo, signal[i])
+    return hi, lo
+
+
 @nb.njit
 def rms(signal):
     """
@@ -53,7 +215,7 @@ def rms(signal):
     signal : numpy array
         Signal to compute the rms value
     """
-    return np.sqrt(np.mean(signal ** 2))
+    return np.sqrt(sum_squares(signal) / signal.size)
 
 
 @nb.njit
@@ -66,7 +228,8 @@ def dynamic_range(signal):
     signal : numpy array
         Signal to compute the dynamic range
     """
-    return np.max(signal) - np.min(signal)
+    hi, lo = max_min(signal)
+    return hi - lo
 
 
 @nb.njit
@@ -81,10 +244,10 @@ def sel(signal, fs):
     fs : int
         Sampling frequency
     """
-    return np.sum(signal ** 2) / fs
+    return sum_squares(signal) / fs
 
 
-@nb.jit
+@nb.njit
 def peak(signal):
     """
     Return the peak value
@@ -94,10 +257,118 @@ def peak(signal):
     signal : numpy array
         Signal to compute the dynamic range
     """
-    return np.max(np.abs(signal))
+    hi, lo = max_min(signal)
+    return max(hi, -lo)
+
+
+@nb.njit(parallel=True, fastmath=True, cache=True)
+def frames_stats(frames):
+    """
+    Return the maximum, minimum, peak and sum of squares of each frame, all of them computed in a single pass
+
+    Parameters
+    ----------
+    frames : numpy matrix
+        2D array of shape (n_frames, n_samples), one frame per row
+
+    Returns
+    -------
+    max_val, min_val, peak_val, sumsq : numpy arrays
+        Arrays of length n_frames with the statistics of each frame
+    """
+    n_frames = frames.shape[0]
+    max_val = np.empty(n_frames)
+    min_val = np.empty(n_frames)
+    peak_val = np.empty(n_frames)
+    sumsq = np.empty(n_frames)
+    for i in nb.prange(n_frames):
+        frame = frames[i]
+        hi = frame[0]
+        lo = frame[0]
+        s = 0.0
+        for x in frame:
+            hi = max(hi, x)
+            lo = min(lo, x)
+            s += x * x
+        max_val[i] = hi
+        min_val[i] = lo
+        peak_val[i] = max(hi, -lo)
+        sumsq[i] = s
+    return max_val, min_val, peak_val, sumsq
+
+
+@nb.njit
+def signal_stats(signal, fs):
+    """
+    Return the rms, the Sound Exposure Level, the peak and the dynamic range of the signal, computed in a single pass
+
+    Parameters
+    ----------
+    signal : numpy array
+        Signal to compute the statistics
+    fs : int
+        Sampling frequency
+    """
+    max_val, min_val, peak_val, sumsq = frames_stats(np.ascontiguousarray(signal).reshape(1, -1))
+    return np.sqrt(sumsq[0] / signal.size), sumsq[0] / fs, peak_val[0], max_val[0] - min_val[0]
+
+
+@nb.njit
+def rms_batched(frames):
+    """
+    Return the rms value of each frame
+
+    Parameters
+    ----------
+    frames : numpy matrix
+        2D array of shape (n_frames, n_samples), one frame per row
+    """
+    return np.sqrt(frames_stats(frames)[3] / frames.shape[1])
+
+
+@nb.njit
+def dynamic_range_batched(frames):
+    """
+    Return the dynamic range of each frame
+
+    Parameters
+    ----------
+    frames : numpy matrix
+        2D array of shape (n_frames, n_samples), one frame per row
+    """
+    max_val, min_val, _, _ = frames_stats(frames)
+    return max_val - min_val
 
 
 @nb.njit
+def sel_batched(frames, fs):
+    """
+    Return the Sound Exposure Level of each frame
+
+    Parameters
+    ----------
+    frames : numpy matrix
+        2D array of shape (n_frames, n_samples), one frame per row
+    fs : int
+        Sampling frequency
+    """
+    return frames_stats(frames)[3] / fs
+
+
+@nb.njit
+def peak_batched(frames):
+    """
+    Return the peak value of each frame
+
+    Parameters
+    ----------
+    frames : numpy matrix
+        2D array of shape (n_frames, n_samples), one frame per row
+    """
+    return frames_stats(frames)[2]
+
+
+@nb.njit(cache=True)
 def set_gain(wave, gain):
     """
     Apply the gain in the same magnitude
@@ -112,7 +383,7 @@ def set_gain(wave, gain):
     return wave * gain
 
 
-@nb.njit
+@nb.njit(cache=True)
 def set_gain_db(wave, gain):
     """
     Apply the gain in db
@@ -127,16 +398,42 @@ def set_gain_db(wave, gain):
     return wave + gain
 
 
-@nb.njit
+@nb.njit(fastmath=True, cache=True)
 def set_gain_upa_db(wave, gain):
     """
     Apply the gain in db to the signal in upa
+
+    Parameters
+    ----------
+    wave : numpy array
+        Signal in upa
+    gain :
+        Gain to apply, in db
     """
-    gain = np.pow(10, gain / 20.0)
-    return gain(wave, gain)
+    # Convert the gain to upa once, not per sample
+    return set_gain(wave, 10.0 ** (gain / 20.0))
 
 
-@nb.njit
+@nb.njit(parallel=True, fastmath=True, cache=True)
+def set_gain_upa_db_inplace(wave, gain):
+    """
+    Apply the gain in db to the signal in upa, overwriting the signal (no new array is allocated)
+
+    Parameters
+    ----------
+    wave : numpy array
+        Contiguous signal in upa
+    gain :
+        Gain to apply, in db
+    """
+    flat_wave = wave.reshape(wave.size)
+    gain_upa = 10.0 ** (gain / 20.0)
+    for i in nb.prange(flat_wave.size):
+        flat_wave[i] *= gain_upa
+    return wave
+
+
+@nb.njit(fastmath=True, error_model='numpy', cache=True)
 def to_mag(wave, ref):
     """
     Compute the upa from the db signals
@@ -148,10 +445,10 @@ def to_mag(wave, ref):
     ref : float
         Reference pressure
     """
-    return np.power(10, wave / 20.0 - np.log10(ref))
+    return np.power(10.0, wave / 20.0) / ref
 
 
-@nb.njit
+@nb.njit(fastmath={'afn'}, error_model='numpy', cache=True)
 def to_db(wave, ref=1.0, square=False):
     """
     Compute the db from the upa signal
@@ -165,19 +462,54 @@ def to_db(wave, ref=1.0, square=False):
     square : boolean
         Set to True if the signal has to be squared
     """
+    # One log10 per sample: numba fuses the element-wise expression into a single loop.
+    # Only approximate functions are allowed (afn, vectorized log10 with SVML), silent samples are still -inf
+    ref_db = 20 * np.log10(ref)
     if square:
-        db = 10 * np.log10(wave ** 2 / ref ** 2)
+        db = 20 * np.log10(np.abs(wave)) - ref_db
     else:
-        db = 10 * np.log10(wave / ref ** 2)
+        db = 10 * np.log10(wave) - ref_db
     return db
 
 
-# @nb.jit
+def gain_to_db(wave, gain, ref=1.0, out=None):
+    """
+    Apply the gain to the signal and convert it to db (squared) in a single pass, equivalent to
+    to_db(set_gain(wave, gain), ref, square=True) without the intermediate array
+
+    Parameters
+    ----------
+    wave : numpy array
+        Signal to convert
+    gain : float
+        Gain to apply, in the same magnitude
+    ref : float
+        Reference pressure
+    out : numpy array or None
+        Contiguous array where the result is written (can be wave itself). If None, a new array is returned
+    """
+    if out is None:
+        out = np.empty(wave.shape)
+    _gain_to_db(np.ravel(wave), float(gain), 20 * np.log10(ref), out.reshape(-1))
+    return out
+
+
+@nb.njit(parallel=True, fastmath={'afn'}, error_model='numpy', cache=True)
+def _gain_to_db(wave, gain, offset, out):
+    for i in nb.prange(wave.size):
+        out[i] = 20 * np.log10(np.abs(wave[i] * gain)) - offset
+
+
 def oct_fbands(min_freq, max_freq, fraction):
-    min_band_n = 0
-    max_band_n = 0
+    # Band numbers from the closed form, corrected with the exact comparisons in case log2 is rounded
+    min_band_n = min(0, int(np.floor(fraction * np.log2(min_freq / 1000))))
+    while min_band_n < 0 and 1000 * 2 ** ((min_band_n + 1) / fraction) <= min_freq:
+        min_band_n += 1
     while 1000 * 2 ** (min_band_n / fraction) > min_freq:
-        min_band_n = min_band_n - 1
+        min_band_n -= 1
+    max_band_n = max(0, int(np.ceil(fraction * np.log2(max_freq / 1000))))
+    while max_band_n > 0 and 1000 * 2 ** ((max_band_n - 1) / fraction) >= max_freq:
+        max_band_n -= 1
     while 1000 * 2 ** (max_band_n / fraction) < max_freq:
         max_band_n += 1
     bands = np.arange(min_band_n, max_band_n)
@@ -205,7 +537,30 @@ def octdsgn(fc, fs, fraction=1, n=2):
       Order specification of the filters, N = 2 gives 4th order, N = 3 gives 6th order
       Higher N can give rise to numerical instability problems, so only 2 or 3 should be used
     """
-    if fc > 0.88 * fs / 2:
+    w1, w2 = _octdsgn_limits(fc, fs, fraction, n)
+    sos = _butter_bandpass(n, w1, w2).copy()
+
+    return sos
+
+
+@functools.lru_cache(maxsize=4096)
+def _butter_bandpass(n, w1, w2):
+    """
+    Return the second-order sections of the bandpass Butterworth filter of order 2n between the normalized
+    frequencies w1 and w2. The designs are cached, as the same filters are designed again for every file with the
+    same sampling frequency. The returned array is read-only, copy it before modifying it
+    """
+    sos = sig.butter(n, [w1, w2], btype='bandpass', output='sos')
+    sos.flags.writeable = False
+    return sos
+
+
+def _octdsgn_limits(fc, fs, fraction, n):
+    """
+    Return the normalized limits (w1, w2) of the Butterworth design of the octave band filters with center
+    frequencies fc. fc and fs can be arrays, to compute the limits of all the filters of a bank at once
+    """
+    if np.any(fc > 0.88 * fs / 2):
         raise Exception('Design not possible - check frequencies')
     # design Butterworth 2N-th-order
     f1 = fc * G ** (-1.0 / (2.0 * fraction))
@@ -215,9 +570,7 @@ def octdsgn(fc, fs, fraction=1, n=2):
     alpha = (1 + np.sqrt(1 + 4 * qd ** 2)) / 2 / qd
     w1 = fc / (fs / 2) / alpha
     w2 = fc / (fs / 2) * alpha
-    sos = sig.butter(n, [w1, w2], btype='bandpass', output='sos')
-
-    return sos
+    return w1, w2
 
 
 def octbankdsgn(fs, bands, fraction=1, n=2):
@@ -239,37 +592,117 @@ def octbankdsgn(fs, bands, fraction=1, n=2):
 
     Returns
     -------
-    b, a : numpy matrix
-      Matrices with filter coefficients, one row per filter.
+    filterbank : numpy array
+      Second-order sections of each filter, with shape (n_bands, n_sections, 6)
     d : numpy array
       Downsampling factors for each filter 1 means no downsampling, 2 means
       downsampling with factor 2, 3 means downsampling with factor 4 and so on.
     fsnew : numpy array
       New sample frequencies.
     """
+    # The design only depends on the parameters, so it is cached and shared by all the bins and files.
+    # fsnew and d are read-only, and the filterbank should not be modified either
+    return _octbankdsgn(fs, tuple(bands), fraction, n)
+
+
+@functools.lru_cache(maxsize=32)
+def _octbankdsgn(fs, bands, fraction, n):
+    bands = np.array(bands)
     uneven = (fraction % 2 != 0)
     fc = f_ref * G ** ((2.0 * bands + 1.0) / (2.0 * fraction)) * np.logical_not(uneven) + uneven * f_ref * G ** (
             bands / fraction)
 
     # limit for center frequency compared to sample frequency
     fclimit = 1 / 200
-    # calculate downsampling factors
-    d = np.ones(len(fc))
-    for i in np.arange(len(fc)):
-        while fc[i] < (fclimit * (fs / 2 ** (d[i] - 1))):
-            d[i] += 1
+    # calculate downsampling factors: the first d where fc >= fclimit * fs / 2 ** (d - 1). The closed form is
+    # corrected with the exact comparisons in case log2 is rounded
+    d = np.maximum(1.0, np.ceil(np.log2(fclimit * fs / fc)) + 1)
+    d[fc < fclimit * (fs / 2 ** (d - 1))] += 1
+    d[(d > 1) & (fc >= fclimit * (fs / 2 ** (d - 2)))] -= 1
     # calculate new sample frequencies
     fsnew = fs / (2 ** (d - 1))
-    # construct filterbank
-    filterbank = []
-    for i in np.arange(len(fc)):
-        # construct filter coefficients
-        sos = octdsgn(fc[i], fsnew[i], fraction, n)
-        filterbank.append(sos)
-
+    # construct filterbank, stacked as (n_bands, n_sections, 6) as all the filters have the same order.
+    # The limits of all the filters are computed at once, only the butter design is done per filter
+    w1, w2 = _octdsgn_limits(fc, fsnew, fraction, n)
+    filterbank = np.stack([_butter_bandpass(n, w1[i], w2[i]) for i in range(len(fc))])
+
+    # The cached arrays are shared by all the callers. The filterbank has to stay writable for sosfilt
+    fsnew.setflags(write=False)
+    d.setflags(write=False)
     return filterbank, fsnew, d
 
 
+@nb.njit(cache=True)
+def _sosfilt_sample(sos, zi, x):
+    """
+    Filter one sample with all the second-order sections, as scipy.signal.sosfilt does (direct form II transposed).
+    The state zi (n_sections, 2) is updated in place. Shared by the filterbank kernels
+    """
+    for k in range(sos.shape[0]):
+        y = sos[k, 0] * x + zi[k, 0]
+        zi[k, 0] = sos[k, 1] * x - sos[k, 4] * y + zi[k, 1]
+        zi[k, 1] = sos[k, 2] * x - sos[k, 5] * y
+        x = y
+    return x
+
+
+@nb.njit(parallel=True, cache=True)
+def sosfilt_bank_sum_squares(sos_bank, x):
+    """
+    Filter the signal with each filter of the bank and return the sum of the squared output of each filter.
+    The filters are applied in parallel, and the filtered signals are never stored.
+    Each filter is applied as scipy.signal.sosfilt does (direct form II transposed, zero initial conditions)
+
+    Parameters
+    ----------
+    sos_bank : numpy array
+        Second-order sections of the filters, with shape (n_filters, n_sections, 6)
+    x : numpy array
+        Signal to filter
+    """
+    n_filters = sos_bank.shape[0]
+    n_sections = sos_bank.shape[1]
+    sum_sq = np.zeros(n_filters)
+    for f in nb.prange(n_filters):
+        sos = sos_bank[f]
+        zi = np.zeros((n_sections, 2))
+        s = 0.0
+        for n in range(x.size):
+            y = _sosfilt_sample(sos, zi, x[n])
+            s += y * y
+        sum_sq[f] = s
+    return sum_sq
+
+
+@nb.njit(parallel=True, cache=True)
+def sosfilt_bank(sos_bank, x):
+    """
+    Filter the signal with each filter of the bank, in parallel.
+    Each filter is applied as scipy.signal.sosfilt does (direct form II transposed, zero initial conditions)
+
+    Parameters
+    ----------
+    sos_bank : numpy array
+        Second-order sections of the filters, with shape (n_filters, n_sections, 6)
+    x : numpy array
+        Signal to filter
+
+    Returns
+    -------
+    y : numpy array
+        Filtered signals, with shape (n_filters, x.size)
+    """
+    n_filters = sos_bank.shape[0]
+    n_sections = sos_bank.shape[1]
+    y = np.empty((n_filters, x.size))
+    for f in nb.prange(n_filters):
+        sos = sos_bank[f]
+        zi = np.zeros((n_sections, 2))
+        for n in range(x.size):
+            y[f, n] = _sosfilt_sample(sos, zi, x[n])
+    return y
+
+
 def get_bands_limits(band, nfft, base, bands_per_division, hybrid_mode):
     """
 
@@ -283,17 +716,27 @@ def get_bands_limits(band, nfft, base, bands_per_division, hybrid_mode):
 
     Returns
     -------
-
+    bands_limits : numpy array
+        Limits of the bands (one more element than bands_c)
+    bands_c : numpy array
+        Centre frequencies of the bands
     """
+    # The limits only depend on the parameters, so they are cached and shared by all the files of a survey.
+    # Copies are returned so the cached arrays are never modified
+    bands_limits, bands_c = _get_bands_limits(tuple(band), nfft, base, bands_per_division, hybrid_mode)
+    return bands_limits.copy(), bands_c.copy()
+
+
+@functools.lru_cache(maxsize=32)
+def _get_bands_limits(band, nfft, base, bands_per_division, hybrid_mode):
     first_bin_centre = 0
     low_side_multiplier = base ** (-1 / (2 * bands_per_division))
     high_side_multiplier = base ** (1 / (2 * bands_per_division))
 
     fft_bin_width = band[1] * 2 / nfft
 
-    # Start the frequencies list
-    bands_limits = []
-    bands_c = []
+    # Start the frequencies arrays (linear and log spaced parts)
+    linear_c = np.empty(0)
 
     # count the number of bands:
     band_count = 0
@@ -323,27 +766,27 @@ def get_bands_limits(band, nfft, base, bands_per_division, hybrid_mode):
         if (fft_bin_width * linear_bin_count) > band[1]:
             linear_bin_count = band[1] / fft_bin_width + 1
 
-        for i in np.arange(linear_bin_count):
-            # Add the frequencies
-            fc = first_bin_centre + i * fft_bin_width
-            if fc >= band[0]:
-                bands_c.append(fc)
-                bands_limits.append(fc - fft_bin_width / 2)
+        # Add the frequencies
+        linear_c = first_bin_centre + np.arange(linear_bin_count) * fft_bin_width
+        linear_c = linear_c[linear_c >= band[0]]
 
     # count the log space frequencies
+    log_c = []
     ls_freq = center_freq * high_side_multiplier
     while ls_freq < band[1]:
         fc = get_center_freq(base, bands_per_division, band_count, band[0])
         ls_freq = fc * high_side_multiplier
-        bands_c.append(fc)
-        bands_limits.append(fc * low_side_multiplier)
+        log_c.append(fc)
         band_count += 1
+    log_c = np.array(log_c)
+    bands_c = np.concatenate([linear_c, log_c])
     # Add the upper limit (bands_limits's length will be +1 compared to bands_c)
     if ls_freq > band[1]:
         ls_freq = band[1]
-        if fc > band[1]:
+        # The last band can not be centred above the upper limit (there might be no band at all)
+        if bands_c.size > 0 and bands_c[-1] > band[1]:
             bands_c[-1] = band[1]
-    bands_limits.append(ls_freq)
+    bands_limits = np.concatenate([linear_c - fft_bin_width / 2, log_c * low_side_multiplier, [ls_freq]])
     return bands_limits, bands_c
 
 
@@ -413,36 +856,33 @@ def spectra_ds_to_bands(psd, bands_limits, bands_c, fft_bin_width, db=True):
     xarray DataArray with frequency_bins instead of frequency as a dimension.
 
     """
-    fft_freq_indices = (np.floor((np.array(bands_limits) + (fft_bin_width / 2)) / fft_bin_width)).astype(int)
+    bands_limits = np.asarray(bands_limits)
+    fft_freq_indices = (np.floor((bands_limits + (fft_bin_width / 2)) / fft_bin_width)).astype(int)
     original_first_fft_index = int(psd.frequency.values[0] / fft_bin_width)
     fft_freq_indices -= original_first_fft_index
 
     if fft_freq_indices[-1] > (len(psd.frequency) - 1):
         fft_freq_indices[-1] = len(psd.frequency) - 1
-    limits_df = pd.DataFrame(data={'lower_indexes': fft_freq_indices[:-1], 'upper_indexes': fft_freq_indices[1:],
-                                   'lower_freq': bands_limits[:-1], 'upper_freq': bands_limits[1:]})
-    limits_df['lower_factor'] = limits_df['lower_indexes'] * fft_bin_width + fft_bin_width / 2 - \
-                                limits_df['lower_freq'] + psd.frequency.values[0]
-    limits_df['upper_factor'] = limits_df['upper_freq'] - \
-                                (limits_df['upper_indexes'] * fft_bin_width - fft_bin_width / 2) - psd.frequency.values[
-                                    0]
-
-    psd_limits_lower = psd.isel(frequency=limits_df['lower_indexes'].values) * [
-        limits_df['lower_factor']] / fft_bin_width
-    psd_limits_upper = psd.isel(frequency=limits_df['upper_indexes'].values) * [
-        limits_df['upper_factor']] / fft_bin_width
-    # Bin the bands and add the borders
-    psd_without_borders = psd.drop_isel(frequency=fft_freq_indices)
-    if len(psd_without_borders.frequency) == 0:
-        psd_bands = xarray.zeros_like(psd)
-        psd_bands = psd_bands.assign_coords({'frequency_bins': ('frequency', bands_c)})
-        psd_bands = psd_bands.swap_dims({'frequency': 'frequency_bins'}).drop('frequency')
-    else:
-        psd_bands = psd_without_borders.groupby_bins('frequency', bins=bands_limits, labels=bands_c, right=False).sum()
-        psd_bands = psd_bands.fillna(0)
-    psd_bands = psd_bands + psd_limits_lower.values + psd_limits_upper.values
-    psd_bands = psd_bands.assign_coords({'lower_frequency': ('frequency_bins', limits_df['lower_freq'])})
-    psd_bands = psd_bands.assign_coords({'upper_frequency': ('frequency_bins', limits_df['upper_freq'])})
+    lower_indexes = fft_freq_indices[:-1]
+    upper_indexes = fft_freq_indices[1:]
+    lower_factor = lower_indexes * fft_bin_width + fft_bin_width / 2 - bands_limits[:-1] + psd.frequency.values[0]
+    upper_factor = bands_limits[1:] - (upper_indexes * fft_bin_width - fft_bin_width / 2) - psd.frequency.values[0]
+
+    # Integrate all the bands at once with a (bands x frequency) sparse matrix
+    bands_matrix = get_bands_matrix(psd.frequency.values, bands_limits, lower_indexes, upper_indexes,
+                                    lower_factor / fft_bin_width, upper_factor / fft_bin_width)
+    psd_values = psd.transpose(..., 'frequency').values
+    bands_values = integrate_bands(np.ascontiguousarray(psd_values.reshape(-1, psd_values.shape[-1])),
+                                   bands_matrix.indptr, bands_matrix.indices, bands_matrix.data)
+    bands_values = bands_values.reshape(psd_values.shape[:-1] + (len(bands_c),))
+
+    coords = {name: coord for name, coord in psd.coords.items() if 'frequency' not in coord.dims}
+    coords['frequency_bins'] = bands_c
+    psd_bands = xarray.DataArray(bands_values, coords=coords, name=psd.name,
+                                 dims=[dim for dim in psd.dims if dim != 'frequency'] + ['frequency_bins'])
+    psd_bands = psd_bands.transpose(*[dim if dim != 'frequency' else 'frequency_bins' for dim in psd.dims])
+    psd_bands = psd_bands.assign_coords({'lower_frequency': ('frequency_bins', bands_limits[:-1])})
+    psd_bands = psd_bands.assign_coords({'upper_frequency': ('frequency_bins', bands_limits[1:])})
 
     bandwidths = psd_bands.upper_frequency - psd_bands.lower_frequency
     psd_bands = psd_bands / bandwidths
@@ -453,6 +893,75 @@ def spectra_ds_to_bands(psd, bands_limits, bands_c, fft_bin_width, db=True):
     return psd_bands
 
 
+def get_bands_matrix(frequency, bands_limits, lower_indexes, upper_indexes, lower_weights, upper_weights):
+    """
+    Return the sparse matrix (bands x frequency bins) that integrates a spectrum into bands.
+    The frequency bins fully inside a band have weight 1, and the bins at the borders of each band (the ones at
+    the lower and upper indexes) are weighted with the proportion of the bin inside the band.
+
+    Parameters
+    ----------
+    frequency: numpy array
+        Frequency axis of the spectrum (centre of the bins)
+    bands_limits: numpy array
+        Limits of the bands (one more element than bands)
+    lower_indexes: numpy array
+        Index of the frequency bin containing the lower limit of each band
+    upper_indexes: numpy array
+        Index of the frequency bin containing the upper limit of each band
+    lower_weights: numpy array
+        Proportion of the lower border bin to add to each band
+    upper_weights: numpy array
+        Proportion of the upper border bin to add to each band
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix of shape (number of bands, number of frequency bins)
+    """
+    n_bands = len(bands_limits) - 1
+    n_freq = len(frequency)
+    # Bins which are not a border of any band are added completely to the band they belong to
+    inner_bins = np.ones(n_freq, dtype=bool)
+    inner_bins[np.concatenate([lower_indexes, upper_indexes])] = False
+    bins_band = np.searchsorted(bands_limits, frequency, side='right') - 1
+    inner_bins &= (bins_band >= 0) & (bins_band < n_bands)
+    inner_idx = np.flatnonzero(inner_bins)
+
+    band_idx = np.arange(n_bands)
+    rows = np.concatenate([bins_band[inner_idx], band_idx, band_idx])
+    cols = np.concatenate([inner_idx, np.mod(lower_indexes, n_freq), np.mod(upper_indexes, n_freq)])
+    weights = np.concatenate([np.ones(len(inner_idx)), lower_weights, upper_weights])
+    # Duplicated entries (i.e. both borders in the same bin) are summed
+    return sparse.coo_matrix((weights, (rows, cols)), shape=(n_bands, n_freq)).tocsr()
+
+
+@nb.njit(parallel=True, fastmath=True, cache=True)
+def integrate_bands(spectra, indptr, indices, weights):
+    """
+    Integrate each spectrum into bands, applying the sparse (csr) bands matrix row by row
+
+    Parameters
+    ----------
+    spectra: numpy array
+        2D array (n spectra x frequency bins)
+    indptr, indices, weights: numpy array
+        csr representation of the bands matrix (see get_bands_matrix)
+
+    Returns
+    -------
+    2D numpy array (n spectra x bands)
+    """
+    n_bands = indptr.size - 1
+    bands = np.zeros((spectra.shape[0], n_bands))
+    for i in nb.prange(spectra.shape[0]):
+        for k in range(n_bands):
+            s = 0.0
+            for j in range(indptr[k], indptr[k + 1]):
+                s += weights[j] * spectra[i, indices[j]]
+            bands[i, k] = s
+    return bands
+
+
 def pcm2float(s, dtype='float64'):
     """
     Convert PCM signal to floating point with a range from -1 to 1.
@@ -478,7 +987,12 @@ def pcm2float(s, dtype='float64'):
     i = np.iinfo(s.dtype)
     abs_max = 2 ** (i.bits - 1)
     offset = i.min + abs_max
-    return (s.astype(dtype) - offset) / abs_max
+    # Only the converted copy is allocated, the offset and the scaling are applied in place
+    out = s.astype(dtype)
+    if offset != 0:
+        out -= offset
+    out /= abs_max
+    return out
 
 
 def merge_ds(ds, new_ds, attrs_to_vars):
@@ -499,18 +1013,11 @@ def merge_ds(ds, new_ds, attrs_to_vars):
     -------
     ds : merged dataset
     """
-    new_coords = {}
-    for attr in attrs_to_vars:
-        if attr in new_ds.attrs.keys():
-            new_coords[attr] = ('id', [new_ds.attrs[attr]] * new_ds.dims['id'])
     if len(ds.dims) != 0:
         start_value = ds['id'][-1].values + 1
     else:
         start_value = 0
-    new_ids = np.arange(start_value, start_value + new_ds.dims['id'])
-    new_ds = new_ds.reset_index('id')
-    new_coords['id'] = new_ids
-    new_ds = new_ds.assign_coords(new_coords)
+    new_ds = _renumber_ds(new_ds, attrs_to_vars, start_value)
     if len(ds.dims) == 0:
         ds = ds.merge(new_ds)
     else:
@@ -519,6 +1026,131 @@ def merge_ds(ds, new_ds, attrs_to_vars):
     return ds
 
 
+def concat_ds(ds_list, attrs_to_vars, attrs=None):
+    """
+    Concatenates all the datasets along id at once. Gives the same result than merging them one by one with
+    merge_ds, but without copying the accumulated dataset at every step.
+
+    Parameters
+    ----------
+    ds_list: list of xarray Dataset
+        Datasets to concatenate, in order
+    attrs_to_vars: list or None
+        List of all the attributes to convert to coordinates (not dimensions)
+    attrs: dict or None
+        Initial attributes of the output dataset. They are updated with the attributes of each dataset
+
+    Returns
+    -------
+    ds : concatenated dataset
+    """
+    if attrs is None:
+        attrs = {}
+    else:
+        attrs = attrs.copy()
+    new_ds_list = []
+    start_value = 0
+    for new_ds in ds_list:
+        new_ds_list.append(_renumber_ds(new_ds, attrs_to_vars, start_value))
+        start_value += new_ds.dims['id']
+        attrs.update(new_ds.attrs)
+    if len(new_ds_list) == 0:
+        ds = xarray.Dataset()
+    elif len(new_ds_list) == 1:
+        ds = xarray.Dataset().merge(new_ds_list[0])
+    else:
+        ds = xarray.concat(new_ds_list, 'id', combine_attrs='drop')
+    ds.attrs = attrs
+    return ds
+
+
+def concat_ds_to_zarr(ds_list, attrs_to_vars, zarr_path, attrs=None):
+    """
+    Same as concat_ds, but each dataset is appended to a zarr store as soon as it is available, so only one of them
+    is in memory at a time. Requires the zarr package
+
+    Parameters
+    ----------
+    ds_list: iterable of xarray Dataset
+        Datasets to concatenate, in order. Can be a generator
+    attrs_to_vars: list or None
+        List of all the attributes to convert to coordinates (not dimensions)
+    zarr_path: str or Path
+        Path of the zarr store. It is overwritten if it exists
+    attrs: dict or None
+        Initial attributes of the output dataset. They are updated with the attributes of each dataset
+
+    Returns
+    -------
+    ds : concatenated dataset, lazily loaded from the zarr store
+    """
+    if attrs is None:
+        attrs = {}
+    else:
+        attrs = attrs.copy()
+    start_value = 0
+    for new_ds in ds_list:
+        attrs.update(new_ds.attrs)
+        new_ds = _renumber_ds(new_ds, attrs_to_vars, start_value)
+        new_ds.attrs = attrs
+        # Store strings with variable length, so longer strings can be appended afterwards
+        for name, var in new_ds.variables.items():
+            if var.dtype.kind == 'U':
+                new_ds[name] = var.astype(object)
+        if start_value == 0:
+            # Keep the full resolution of the datetimes for all the appended datasets
+            encoding = {name: {'units': 'nanoseconds since 1970-01-01'} for name, var in new_ds.variables.items()
+                        if var.dtype.kind == 'M'}
+            new_ds.to_zarr(zarr_path, mode='w', encoding=encoding)
+        else:
+            new_ds.to_zarr(zarr_path, mode='a', append_dim='id')
+        start_value += new_ds.dims['id']
+    if start_value == 0:
+        return xarray.Dataset(attrs=attrs)
+    return xarray.open_zarr(zarr_path)
+
+
+def _renumber_ds(new_ds, attrs_to_vars, start_value):
+    """
+    Return the dataset with the ids starting at start_value, and the attributes attrs_to_vars as coordinates
+    along id
+
+    Parameters
+    ----------
+    new_ds: xarray Dataset
+        Dataset with an id dimension
+    attrs_to_vars: list or None
+        List of all the attributes to convert to coordinates (not dimensions)
+    start_value: int
+        First id
+    """
+    n_id = new_ds.dims['id']
+    new_coords = {}
+    for attr in attrs_to_vars:
+        if attr in new_ds.attrs.keys():
+            new_coords[attr] = ('id', np.full(n_id, new_ds.attrs[attr]))
+    new_coords['id'] = np.arange(start_value, start_value + n_id)
+    return new_ds.reset_index('id').assign_coords(new_coords)
+
+
+def concat_df(df_list):
+    """
+    Concatenates all the DataFrames at once. Returns an empty DataFrame if the list is empty
+
+    Parameters
+    ----------
+    df_list: list of pandas DataFrame
+        DataFrames to concatenate, in order
+
+    Returns
+    -------
+    df : concatenated DataFrame
+    """
+    if len(df_list) == 0:
+        return pd.DataFrame()
+    return pd.concat(df_list)
+
+
 def compute_spd(psd_evolution, h=1.0, percentiles=None, max_val=None, min_val=None):
     pxx = psd_evolution['band_density'].to_numpy().T
     if percentiles is None:
@@ -529,7 +1161,8 @@ def compute_spd(psd_evolution, h=1.0, percentiles=None, max_val=None, min_val=No
         max_val = pxx.max()
     # Calculate the bins of the psd values and compute spd using numba
     bin_edges = np.arange(start=max(0, min_val), stop=max_val, step=h)
-    spd, p = sxx2spd(sxx=pxx, h=h, percentiles=np.array(percentiles) / 100.0, bin_edges=bin_edges)
+    spd, p = sxx2spd(sxx=np.ascontiguousarray(pxx), h=h, percentiles=np.array(percentiles, dtype=np.float64) / 100.0,
+                     bin_edges=bin_edges)
     spd_arr = xarray.DataArray(data=spd,
                                coords={'frequency': psd_evolution.frequency, 'spl': bin_edges[:-1]},
                                dims=['frequency', 'spl'])
@@ -1,6 +1,11 @@
 import unittest
 import pathlib
+import datetime
+import shutil
+import tempfile
+import zipfile
 import matplotlib.pyplot as plt
+import numpy as np
 
 from pypam.acoustic_survey import ASA
 import pyhydrophone as pyhy
@@ -48,11 +53,44 @@ class TestASA(unittest.TestCase):
             ASA(hydrophone=soundtrap, folder_path=folder_path.joinpath('empty_folder'), binsize=binsize,
                 nfft=nfft, timezone='UTC', include_dirs=include_dirs, zipped=zipped_files, dc_subtract=dc_subtract)
 
+    def test_wavs_in_subfolder(self):
+        # A folder with wav files only in its subfolders is not empty, even if the subfolders are not included
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sub_folder = pathlib.Path(tmp_dir).joinpath('sub_folder')
+            sub_folder.mkdir()
+            shutil.copy(folder_path.joinpath('67416073.210610033655.wav'), sub_folder)
+            ASA(hydrophone=soundtrap, folder_path=tmp_dir, binsize=binsize, nfft=nfft, timezone='UTC',
+                include_dirs=False, zipped=zipped_files, dc_subtract=dc_subtract)
+
     def test_path_not_exists(self):
         with self.assertRaises(FileNotFoundError) as context:
             ASA(hydrophone=soundtrap, folder_path='non_existing_folder', binsize=binsize,
                 nfft=nfft, timezone='UTC', include_dirs=include_dirs, zipped=zipped_files, dc_subtract=dc_subtract)
 
+    def test_time_filter(self):
+        # Only the file starting at 03:41:55 can contain data of this period
+        time_filter = [(datetime.datetime(2021, 6, 10, 3, 43), datetime.datetime(2021, 6, 10, 3, 44))]
+        asa = ASA(hydrophone=soundtrap, folder_path=folder_path, binsize=binsize, nfft=nfft, timezone='UTC',
+                  include_dirs=include_dirs, zipped=zipped_files, dc_subtract=dc_subtract, time_filter=time_filter)
+        files = [sound_file.file_path.name for sound_file in asa._files()]
+        assert files == ['67416073.210610034155.wav']
+
+    def test_time_filter_zip(self):
+        # The names of the files are read from the zip file, nothing is extracted to select them
+        time_filter = [(datetime.datetime(2021, 6, 10, 3, 43), datetime.datetime(2021, 6, 10, 3, 44))]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            zip_path = pathlib.Path(tmp_dir).joinpath('test_data.zip')
+            with zipfile.ZipFile(zip_path, 'w') as zf:
+                for wav_file in sorted(folder_path.glob('*.wav')):
+                    zf.write(wav_file, 'folder/%s' % wav_file.name)
+            asa = ASA(hydrophone=soundtrap, folder_path=zip_path, binsize=binsize, nfft=nfft, timezone='UTC',
+                      include_dirs=False, zipped=True, dc_subtract=dc_subtract, time_filter=time_filter,
+                      extract_workers=2)
+            self.assertEqual(len(asa.acu_files._extracted), 0)
+            files = [sound_file.file_path.name for sound_file in asa._files()]
+            assert files == ['67416073.210610034155.wav']
+            asa.acu_files.close()
+
     def test_timestamp_array(self):
         self.asa.timestamps_array()
 
@@ -62,6 +100,41 @@ class TestASA(unittest.TestCase):
     def test_features(self):
         self.asa.evolution_multiple(method_list=fast_features, band_list=band_list)
 
+    def test_parallel_files(self):
+        # The files processed in other processes give the same output, in the same order
+        asa = ASA(hydrophone=soundtrap, folder_path=folder_path, binsize=binsize, nfft=nfft, timezone='UTC',
+                  include_dirs=include_dirs, zipped=zipped_files, dc_subtract=dc_subtract, n_jobs=2)
+        ds = asa.evolution_multiple(method_list=fast_features, band_list=band_list)
+        ds_serial = self.asa.evolution_multiple(method_list=fast_features, band_list=band_list)
+        self.assertTrue(ds.identical(ds_serial))
+
+    def test_cut_and_place_adjacent_periods(self):
+        # The files split by the first cut have to be selected by the time filter of the second one
+        periods = [(datetime.datetime(2021, 6, 10, 3, 40), datetime.datetime(2021, 6, 10, 3, 43)),
+                   (datetime.datetime(2021, 6, 10, 3, 43), datetime.datetime(2021, 6, 10, 3, 45))]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for wav_file in folder_path.glob('*.wav'):
+                shutil.copy(wav_file, tmp_dir)
+            asa = ASA(hydrophone=soundtrap, folder_path=tmp_dir, binsize=binsize, nfft=nfft, timezone='UTC',
+                      include_dirs=False, zipped=zipped_files, dc_subtract=dc_subtract,
+                      time_filter=[(periods[0][0], periods[1][1])])
+            for i, period in enumerate(periods):
+                asa.cut_and_place_files_period(period, 'period_%s' % i)
+            for i, (start, end) in enumerate(periods):
+                period_asa = ASA(hydrophone=soundtrap, folder_path=pathlib.Path(tmp_dir).joinpath('period_%s' % i),
+                                 binsize=binsize, nfft=nfft, timezone='UTC', include_dirs=False,
+                                 zipped=zipped_files, dc_subtract=dc_subtract)
+                self.assertAlmostEqual(period_asa.duration(), (end - start).total_seconds(), delta=1)
+
+    def test_mean_rms(self):
+        rms_evolution = self.asa.evolution('rms', band_list=band_list)
+        np.testing.assert_allclose(self.asa.mean_rms(band_list=band_list), rms_evolution['rms'].mean())
+        # No file in the period
+        asa = ASA(hydrophone=soundtrap, folder_path=folder_path, binsize=binsize, nfft=nfft, timezone='UTC',
+                  include_dirs=include_dirs, zipped=zipped_files, dc_subtract=dc_subtract,
+                  period=['2000-01-01 00:00:00', '2000-01-02 00:00:00'])
+        self.assertTrue(np.isnan(asa.mean_rms(band_list=band_list)))
+
     def test_third_oct(self):
         ds = self.asa.evolution_freq_dom('spectrogram', band=third_octaves, db=True)
         print(ds)
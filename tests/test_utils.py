@@ -82,3 +82,58 @@ def test_psd_to_millidecades(artificial_data):
 
     # Check if the results are the same
     assert ((mdec_power_test['sum'] - milli_psd_power.sel(id=0).values).abs() > 1e-5).sum() == 0
+
+
+def test_rms_sel(artificial_data):
+    data, _, fs = artificial_data
+    assert np.isclose(utils.rms(data), np.sqrt(np.mean(data ** 2)))
+    assert np.isclose(utils.sel(data, fs), np.sum(data ** 2) / fs)
+    assert np.isclose(utils.rms(data[::3]), np.sqrt(np.mean(data[::3] ** 2)))
+
+
+def test_welch(artificial_data):
+    data, _, fs = artificial_data
+    window = scipy.signal.get_window('hann', 4096)
+    for scaling in ['density', 'spectrum']:
+        freq, psd = scipy.signal.welch(data, fs=fs, window=window, scaling=scaling, noverlap=2048, detrend=False)
+        freq_utils, psd_utils = utils.welch(data, fs, window, noverlap=2048, scaling=scaling)
+        assert np.allclose(freq, freq_utils)
+        assert np.allclose(psd, psd_utils)
+
+
+def test_gain_db(artificial_data):
+    data, _, _ = artificial_data
+    assert np.allclose(utils.set_gain_upa_db(data, 20.0), data * 10)
+    assert np.allclose(utils.set_gain_upa_db_inplace(data.copy(), 20.0), data * 10)
+    db = utils.to_db(data, ref=1.0, square=True)
+    assert np.allclose(utils.to_mag(db, ref=1.0), np.abs(data))
+    assert np.allclose(utils.gain_to_db(data, 10.0, ref=1e-6), utils.to_db(data * 10, ref=1e-6, square=True))
+
+
+def test_batched_stats(artificial_data):
+    data, _, fs = artificial_data
+    frames = data[:fs // 1000 * 1000].reshape(1000, -1)
+    for batched, scalar in [(utils.rms_batched, utils.rms), (utils.peak_batched, utils.peak),
+                            (utils.dynamic_range_batched, utils.dynamic_range)]:
+        assert np.allclose(batched(frames), [scalar(frame) for frame in frames])
+    assert np.allclose(utils.sel_batched(frames, fs), [utils.sel(frame, fs) for frame in frames])
+    assert np.allclose(utils.signal_stats(data, fs), [utils.rms(data), utils.sel(data, fs), utils.peak(data),
+                                                      utils.dynamic_range(data)])
+
+
+def test_sxx_percentiles(artificial_data):
+    data, _, _ = artificial_data
+    sxx = np.ascontiguousarray(data[:500 * 1000].reshape(500, -1))
+    bin_edges = np.arange(-300, 250, 0.7)
+    # Percentiles between two counts, where sxx2spd is not affected by rounding
+    percentiles = np.array([0.0, 0.0125, 0.1234, 0.5005, 0.9015, 0.9555, 1.0])
+    _, p = utils.sxx2spd(sxx=sxx, h=0.7, percentiles=percentiles, bin_edges=bin_edges)
+    assert np.array_equal(utils.sxx_percentiles(sxx, percentiles, bin_edges), p)
+
+
+def test_sosfilt_bank_sum_squares(artificial_data):
+    data, _, fs = artificial_data
+    filterbank, _, _ = utils.octbankdsgn(fs, np.arange(-2, 3), 3, 2)
+    sum_sq = utils.sosfilt_bank_sum_squares(filterbank, data)
+    assert np.allclose(sum_sq, [np.sum(scipy.signal.sosfilt(sos, data) ** 2) for sos in filterbank])
+    assert np.allclose(utils.sosfilt_bank(filterbank, data), [scipy.signal.sosfilt(sos, data) for sos in filterbank])